@@ -1,15 +1,30 @@
 import asyncio
 import contextlib
-import logging
 
 import uvicorn
-from aiohttp import ClientSession
 from dotenv import load_dotenv
 from starlette.applications import Starlette
 
+from abd.utils.admission import admission
+from abd.utils.aggregates import aggregates
+from abd.utils.coalescer import bursts
+from abd.utils.coalescer import updates
+from abd.utils.coordinator import coordinator
 from abd.utils.env import env
+from abd.utils.events import handle_event
+from abd.utils.health import prober
+from abd.utils.http import create_session
+from abd.utils.ledger import ledger
 from abd.utils.logging import send_heartbeat
+from abd.utils.logging import setup_logging
 from abd.utils.monzo.checker import test_auth
+from abd.utils.monzo.refresher import refresher
+from abd.utils.outbox import outbox
+from abd.utils.queue import queue
+from abd.utils.scheduler import scheduler
+from abd.utils.slack import load_slack
+from abd.utils.state import store
+from abd.utils.tenants import tenants
 
 load_dotenv()
 
@@ -20,17 +35,53 @@ try:
 except ImportError:
     pass
 
-logging.basicConfig(level="INFO")
+setup_logging()
+
+
+async def lead():
+    # background jobs that only one worker should run
+    checkers = [asyncio.create_task(test_auth(tenant)) for tenant in tenants]
+    store.start()
+    refresher.start()
+    try:
+        await asyncio.Future()
+    finally:
+        for checker in checkers:
+            checker.cancel()
+        await asyncio.gather(*checkers, return_exceptions=True)
+        await refresher.stop()
+        await store.stop()
 
 
 @contextlib.asynccontextmanager
 async def main(_app: Starlette):
-    await send_heartbeat(":ac-bells: ADB is online!")
-    async with ClientSession() as session:
-        env.session = session
-        env.monzo_client.session = session
-        asyncio.create_task(test_auth())
+    async with create_session() as session:
+        env.use_session(session)
+        # the Slack libraries load off the event loop while the rest starts up,
+        # and everything that talks to Slack waits for them
+        loading = asyncio.create_task(asyncio.to_thread(load_slack))
+        tenants.set_session(session)
+        store.load()
+        ledger.start()
+        await aggregates.start()
+        await loading
+        await coordinator.start(lead)
+        queue.start()
+        outbox.start(handle_event)
+        prober.start()
+        online = asyncio.create_task(send_heartbeat(":ac-bells: ADB is online!"))
         yield
+        await asyncio.gather(online, return_exceptions=True)
+        await prober.stop()
+        await admission.stop()
+        await outbox.stop()
+        await queue.stop(env.shutdown_timeout)
+        await bursts.stop()
+        await updates.stop()
+        await scheduler.stop(env.shutdown_timeout)
+        await coordinator.stop()
+        await aggregates.stop()
+        await ledger.stop()
 
 
 def start():
@@ -38,7 +89,10 @@ def start():
         "abd.utils.starlette:app",
         host="0.0.0.0",
         port=env.port,
+        workers=env.workers,
         log_level="info" if env.environment != "production" else "warning",
+        # uvicorn's records go through the same queue as ours
+        log_config=None,
     )
 
 
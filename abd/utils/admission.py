@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+
+from starlette.requests import Request
+
+from abd.utils.env import env
+from abd.utils.logging import send_heartbeat
+from abd.utils.metrics import metrics
+from abd.utils.queue import queue
+from abd.utils.ratelimit import TokenBucket
+
+
+class Admission:
+    def __init__(
+        self,
+        max_body: int,
+        rate: float,
+        burst: float,
+        shed_depth: int,
+        report_interval: float,
+        max_sources: int = 10000,
+    ) -> None:
+        self.max_body = max_body
+        self.rate = rate
+        self.burst = burst
+        self.shed_depth = shed_depth
+        self.report_interval = report_interval
+        self.max_sources = max_sources
+        self.sources: OrderedDict[str, TokenBucket] = OrderedDict()
+        self.rejected: dict[str, int] = {}
+        self.pending: dict[str, int] = {}
+        self.samples: list[str] = []
+        self.reported_at = -math.inf
+        self.reporting: asyncio.Task | None = None
+
+    @property
+    def retry_after(self) -> str:
+        return str(math.ceil(1 / self.rate)) if self.rate > 0 else "1"
+
+    def allow(self, source: str) -> bool:
+        if self.rate <= 0:
+            return True
+        bucket = self.sources.get(source)
+        if bucket is None:
+            bucket = self.sources[source] = TokenBucket(self.rate, self.burst)
+            while len(self.sources) > self.max_sources:
+                self.sources.popitem(last=False)
+        else:
+            self.sources.move_to_end(source)
+        return bucket.try_acquire()
+
+    def shed(self) -> int | None:
+        if not queue.enabled:
+            return None
+        if queue.queue.full():
+            return 503
+        if queue.queue.qsize() >= self.shed_depth:
+            return 429
+        return None
+
+    async def read_body(self, req: Request) -> bytes | None:
+        length = req.headers.get("content-length", "")
+        if length.isdigit() and int(length) > self.max_body:
+            return None
+        chunks = []
+        size = 0
+        async for chunk in req.stream():
+            size += len(chunk)
+            if size > self.max_body:
+                return None
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def reject(self, reason: str, sample: str):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        self.pending[reason] = self.pending.get(reason, 0) + 1
+        if len(self.samples) < 5:
+            self.samples.append(sample)
+        if not self.reporting or self.reporting.done():
+            self.reporting = asyncio.create_task(self.report())
+
+    async def report(self):
+        # one summary per interval however many requests are turned away
+        while self.pending:
+            await asyncio.sleep(
+                max(0, self.reported_at + self.report_interval - time.monotonic())
+            )
+            pending, samples = self.pending, self.samples
+            self.pending, self.samples = {}, []
+            self.reported_at = time.monotonic()
+
+            total = sum(pending.values())
+            reasons = ", ".join(
+                f"{count} {reason}" for reason, count in pending.items()
+            )
+            summary = f"Rejected {total} webhook{'s' if total != 1 else ''} ({reasons})"
+            logging.warning(summary)
+            try:
+                await send_heartbeat(heartbeat=summary, messages=samples)
+            except Exception:
+                logging.exception("Failed to report rejected webhooks")
+
+    async def stop(self):
+        if self.reporting:
+            self.reporting.cancel()
+            await asyncio.gather(self.reporting, return_exceptions=True)
+
+
+admission = Admission(
+    max_body=env.webhook_max_body,
+    rate=env.webhook_source_rate,
+    burst=env.webhook_source_burst,
+    shed_depth=env.webhook_shed_depth,
+    report_interval=env.rejection_report_interval,
+)
+
+metrics.collector(
+    "abd_webhook_rejected_total",
+    "Webhooks turned away before parsing by reason",
+    "counter",
+    lambda: [
+        ("", {"reason": reason}, count) for reason, count in admission.rejected.items()
+    ],
+)
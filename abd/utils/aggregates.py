@@ -0,0 +1,184 @@
+import asyncio
+import logging
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+
+from abd.utils.coordinator import coordinator
+from abd.utils.env import env
+from abd.utils.ledger import ledger
+from abd.utils.monzo.types import TransactionData
+from abd.utils.monzo.types import TransactionSchemes
+
+# moving money into your own pots isn't spending
+EXCLUDED = {TransactionSchemes.PotTransfer.value}
+
+
+class Day:
+    __slots__ = ("spent", "merchants")
+
+    def __init__(self) -> None:
+        # (currency, category) -> minor units, (currency, merchant id) -> [minor units, count]
+        self.spent: dict[tuple[str, str], int] = {}
+        self.merchants: dict[tuple[str, str], list[int]] = {}
+
+
+class Aggregates:
+    def __init__(self, timezone: str, retention: int) -> None:
+        self.timezone = ZoneInfo(timezone)
+        self.retention = retention
+        self.days: dict[str, dict[date, Day]] = {}
+        self.merchant_names: dict[str, str] = {}
+        # with several workers each one tails the shared ledger instead
+        self.following = False
+        self.position = 0
+        self.task: asyncio.Task | None = None
+
+    def today(self) -> date:
+        return datetime.now(self.timezone).date()
+
+    def add(
+        self,
+        tenant: str,
+        when: datetime,
+        scheme: str,
+        category: str | None,
+        amount: int,
+        currency: str,
+        merchant_id: str | None,
+        merchant_name: str | None,
+    ):
+        if amount >= 0 or scheme in EXCLUDED:
+            return
+        day = when.astimezone(self.timezone).date()
+        days = self.days.setdefault(tenant, {})
+        bucket = days.get(day)
+        if bucket is None:
+            if (self.today() - day).days > self.retention:
+                return
+            bucket = days[day] = Day()
+            self.prune(days)
+
+        key = (currency, category or "general")
+        bucket.spent[key] = bucket.spent.get(key, 0) - amount
+        if merchant_id:
+            totals = bucket.merchants.setdefault((currency, merchant_id), [0, 0])
+            totals[0] -= amount
+            totals[1] += 1
+            if merchant_name:
+                self.merchant_names[merchant_id] = merchant_name
+
+    def add_transaction(self, tenant: str, data: TransactionData):
+        if data.decline_reason or self.following:
+            return
+        merchant = data.merchant
+        self.add(
+            tenant,
+            datetime.fromisoformat(data.created) if data.created else datetime.now(),
+            data.scheme,
+            data.category,
+            data.amount,
+            data.currency,
+            merchant.id if merchant else None,
+            merchant.name if merchant else None,
+        )
+
+    def prune(self, days: dict[date, Day]):
+        cutoff = self.today() - timedelta(days=self.retention)
+        for day in [day for day in days if day < cutoff]:
+            del days[day]
+
+    def window(self, tenant: str, since: date) -> list[Day]:
+        days = self.days.get(tenant, {})
+        count = (self.today() - since).days + 1
+        return [
+            bucket
+            for bucket in (days.get(since + timedelta(days=i)) for i in range(count))
+            if bucket
+        ]
+
+    def spent(
+        self, tenant: str, since: date, category: str | None = None
+    ) -> dict[str, int]:
+        totals: dict[str, int] = {}
+        for bucket in self.window(tenant, since):
+            for (currency, bucket_category), amount in bucket.spent.items():
+                if category is None or bucket_category == category:
+                    totals[currency] = totals.get(currency, 0) + amount
+        return totals
+
+    def top_merchants(
+        self, tenant: str, since: date, limit: int = 5
+    ) -> list[tuple[str, str, int, int]]:
+        totals: dict[tuple[str, str], list[int]] = {}
+        for bucket in self.window(tenant, since):
+            for key, (amount, count) in bucket.merchants.items():
+                total = totals.setdefault(key, [0, 0])
+                total[0] += amount
+                total[1] += count
+        top = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        return [
+            (self.merchant_names.get(merchant_id, merchant_id), currency, amount, count)
+            for (currency, merchant_id), (amount, count) in top
+        ]
+
+    def apply(self, rows: list[tuple]):
+        for tenant, created, *rest in rows:
+            when = datetime.fromtimestamp(created / 1000, self.timezone)
+            self.add(tenant, when, *rest)
+
+    async def rebuild(self, position: int):
+        since = datetime.now(self.timezone) - timedelta(days=self.retention)
+        rows = await ledger.query(
+            "SELECT tenant, created, scheme, category, amount, currency, merchant_id, merchant_name"
+            " FROM transactions WHERE created >= ? AND rowid <= ? AND declined = 0 AND amount < 0",
+            (int(since.timestamp() * 1000), position),
+        )
+        self.apply(rows)
+        logging.info(f"Rebuilt spending aggregates from {len(rows)} transactions")
+
+    async def follow(self):
+        while True:
+            try:
+                rows = await ledger.query(
+                    "SELECT rowid, tenant, created, scheme, category, amount, currency, merchant_id, merchant_name"
+                    " FROM transactions WHERE rowid > ? AND declined = 0 ORDER BY rowid LIMIT 1000",
+                    (self.position,),
+                )
+                if rows:
+                    self.position = rows[-1][0]
+                    self.apply([row[1:] for row in rows])
+            except Exception:
+                logging.exception("Failed to follow the ledger")
+            await asyncio.sleep(coordinator.interval)
+
+    async def run(self, position: int):
+        try:
+            await self.rebuild(position)
+        except Exception:
+            logging.exception("Failed to rebuild spending aggregates")
+        if self.following:
+            await self.follow()
+
+    async def start(self):
+        if not ledger.enabled:
+            if coordinator.enabled:
+                logging.warning(
+                    "Without LEDGER_PATH /monzo only counts this worker's transactions"
+                )
+            return
+        # everything after this row arrives live, so the rebuild can happen in the background
+        [(self.position,)] = await ledger.query(
+            "SELECT coalesce(max(rowid), 0) FROM transactions"
+        )
+        self.following = coordinator.enabled
+        self.task = asyncio.create_task(self.run(self.position))
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+
+aggregates = Aggregates(env.timezone, env.aggregate_days)
@@ -0,0 +1,98 @@
+import logging
+import time
+
+from abd.utils.env import env
+from abd.utils.metrics import metrics
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name: str) -> None:
+        super().__init__(f"{name} circuit is open")
+        self.name = name
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, threshold: int, reset_timeout: float) -> None:
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial_at: float | None = None
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.ready() else "open"
+
+    def ready(self) -> bool:
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if self.trial_at is not None and now - self.trial_at < self.reset_timeout:
+            return False
+        return now - self.opened_at >= self.reset_timeout
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self.ready():
+            # a single request finds out whether the service is back
+            self.trial_at = time.monotonic()
+            return True
+        self.rejected += 1
+        return False
+
+    def success(self):
+        if self.opened_at is not None:
+            logging.info(f"{self.name} recovered, closing its circuit")
+        self.failures = 0
+        self.opened_at = None
+        self.trial_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.opened_at is None and self.failures < self.threshold:
+            return
+        if self.opened_at is None:
+            self.trips += 1
+            logging.warning(
+                f"{self.name} failed {self.failures} times in a row, pausing calls for {self.reset_timeout}s"
+            )
+        self.opened_at = time.monotonic()
+        self.trial_at = None
+
+
+slack_breaker = CircuitBreaker("Slack", env.breaker_threshold, env.breaker_reset)
+monzo_breaker = CircuitBreaker("Monzo", env.breaker_threshold, env.breaker_reset)
+BREAKERS = {"slack": slack_breaker, "monzo": monzo_breaker}
+
+metrics.collector(
+    "abd_circuit_open",
+    "Whether calls to a dependency are paused after repeated failures",
+    "gauge",
+    lambda: [
+        ("", {"dependency": name}, int(breaker.opened_at is not None))
+        for name, breaker in BREAKERS.items()
+    ],
+)
+metrics.collector(
+    "abd_circuit_trips_total",
+    "Times a dependency's circuit opened",
+    "counter",
+    lambda: [
+        ("", {"dependency": name}, breaker.trips) for name, breaker in BREAKERS.items()
+    ],
+)
+metrics.collector(
+    "abd_circuit_rejected_total",
+    "Calls failed fast while a dependency's circuit was open",
+    "counter",
+    lambda: [
+        ("", {"dependency": name}, breaker.rejected)
+        for name, breaker in BREAKERS.items()
+    ],
+)
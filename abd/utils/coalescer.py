@@ -0,0 +1,77 @@
+import asyncio
+import contextlib
+import logging
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Hashable
+
+from abd.utils.env import env
+from abd.utils.metrics import metrics
+
+
+class Batcher:
+    def __init__(self, window: float) -> None:
+        self.window = window
+        self.batches: dict[
+            Hashable, tuple[list, Callable[[list], Awaitable], float]
+        ] = {}
+        self.tasks: dict[Hashable, asyncio.Task] = {}
+        self.closing = asyncio.Event()
+        self.batched = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def add(
+        self,
+        key: Hashable,
+        item: Any,
+        flush: Callable[[list], Awaitable],
+        wait: float | None = None,
+    ):
+        # everything added under a key while its window is open is flushed together,
+        # the first item can close the window sooner than the full length
+        batch = self.batches.get(key)
+        if batch:
+            batch[0].append(item)
+            self.batched += 1
+        else:
+            self.batches[key] = ([item], flush, self.window if wait is None else wait)
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.create_task(self.run(key))
+
+    async def run(self, key: Hashable):
+        try:
+            while key in self.batches:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self.closing.wait(), self.batches[key][2])
+                items, flush, _wait = self.batches.pop(key)
+                try:
+                    await flush(items)
+                except Exception:
+                    logging.exception(f"Failed to flush batch for {key}")
+        finally:
+            del self.tasks[key]
+
+    async def stop(self):
+        self.closing.set()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+
+updates = Batcher(env.update_window)
+bursts = Batcher(env.coalesce_window)
+
+metrics.collector(
+    "abd_updates_coalesced_total",
+    "Transaction updates folded into a later update for the same transaction",
+    "counter",
+    lambda: [("", {}, updates.batched)],
+)
+metrics.collector(
+    "abd_transactions_batched_total",
+    "Transactions posted as part of an earlier transaction's message",
+    "counter",
+    lambda: [("", {}, bursts.batched)],
+)
@@ -0,0 +1,321 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+
+from abd.utils.env import env
+from abd.utils.metrics import metrics
+from abd.utils.tenants import Tenant
+from abd.utils.tenants import tenants
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS kv_version ON kv (version);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS seen (
+    key TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS seen_at ON seen (seen_at);
+CREATE TABLE IF NOT EXISTS cursors (
+    tenant TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    created_ms INTEGER NOT NULL,
+    created TEXT NOT NULL,
+    id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (tenant, account_id)
+);
+CREATE INDEX IF NOT EXISTS cursors_version ON cursors (version);
+CREATE TABLE IF NOT EXISTS messages (
+    tx_id TEXT PRIMARY KEY,
+    channel TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    lines TEXT NOT NULL
+);
+"""
+
+ACQUIRE = """
+INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?)
+ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires
+WHERE leases.owner = excluded.owner OR leases.expires < ?
+"""
+
+PUBLISH = """
+INSERT INTO kv (key, value, version)
+VALUES (?, ?, (SELECT coalesce(max(version), 0) + 1 FROM kv))
+ON CONFLICT (key) DO UPDATE SET value = excluded.value, version = excluded.version
+"""
+
+SEEN = """
+INSERT INTO seen (key, seen_at) VALUES (?, ?)
+ON CONFLICT (key) DO UPDATE SET seen_at = excluded.seen_at WHERE seen.seen_at < ?
+"""
+
+CURSOR = """
+INSERT INTO cursors (tenant, account_id, created_ms, created, id, version)
+VALUES (?, ?, ?, ?, ?, (SELECT coalesce(max(version), 0) + 1 FROM cursors))
+ON CONFLICT (tenant, account_id) DO UPDATE
+SET created_ms = excluded.created_ms, created = excluded.created, id = excluded.id,
+    version = excluded.version
+WHERE excluded.created_ms > cursors.created_ms
+"""
+
+
+class Coordinator:
+    def __init__(
+        self, path: str | None, interval: float = 1, lease: float = 10
+    ) -> None:
+        self.path = path
+        self.interval = interval
+        self.lease = lease
+        self.id = f"{socket.gethostname()}:{os.getpid()}"
+        self.db: sqlite3.Connection | None = None
+        # the connection lives on one thread so a busy database never stalls the event loop
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="coordinator")
+        self.version = 0
+        self.cursor_version = 0
+        self.counts = {"seen": 0, "messages": 0}
+        self.applying = False
+        self.pushed: dict[tuple[str, str], str] = {}
+        self.lead: Callable[[], Awaitable] | None = None
+        self.leading: asyncio.Task | None = None
+        self.task: asyncio.Task | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    @property
+    def leader(self) -> bool:
+        return self.leading is not None
+
+    def connect(self):
+        self.db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        if not self.db:
+            self.connect()
+        return self.db.execute(sql, params)
+
+    async def call(self, fn: Callable[..., Any], *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, fn, *args
+        )
+
+    async def query(self, sql: str, params: tuple = ()) -> list[tuple]:
+        return await self.call(lambda: self.execute(sql, params).fetchall())
+
+    async def write(self, sql: str, params: tuple = ()) -> int:
+        return await self.call(lambda: self.execute(sql, params).rowcount)
+
+    def submit(self, sql: str, params: tuple = ()):
+        # for writes nothing waits on, they still run in order with everything else
+        self.executor.submit(self.execute, sql, params).add_done_callback(self.written)
+
+    def written(self, future: Future):
+        if future.exception():
+            logging.error("Coordinator write failed", exc_info=future.exception())
+
+    async def acquire(self, name: str, ttl: float) -> bool:
+        now = time.time()
+        return await self.write(ACQUIRE, (name, self.id, now + ttl, now)) == 1
+
+    async def release(self, name: str):
+        await self.write(
+            "DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.id)
+        )
+
+    async def seen(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        return await self.write(SEEN, (key, now, now - ttl)) == 0
+
+    def forget(self, key: str):
+        self.submit("DELETE FROM seen WHERE key = ?", (key,))
+
+    async def message(self, tx_id: str) -> tuple[str, str, str] | None:
+        rows = await self.query(
+            "SELECT channel, ts, lines FROM messages WHERE tx_id = ?", (tx_id,)
+        )
+        return rows[0] if rows else None
+
+    async def put_message(self, tx_id: str, channel: str, ts: str, lines: str):
+        await self.write(
+            "INSERT OR REPLACE INTO messages (tx_id, channel, ts, lines) VALUES (?, ?, ?, ?)",
+            (tx_id, channel, ts, lines),
+        )
+
+    def count(self) -> dict[str, int]:
+        return {
+            "seen": self.execute("SELECT count(*) FROM seen").fetchone()[0],
+            "messages": self.execute("SELECT count(*) FROM messages").fetchone()[0],
+        }
+
+    def prune(self):
+        self.execute(
+            "DELETE FROM seen WHERE seen_at < ?", (time.time() - env.dedup_ttl,)
+        )
+        self.execute(
+            "DELETE FROM messages WHERE rowid <= (SELECT max(rowid) FROM messages) - ?",
+            (env.message_index_size,),
+        )
+
+    def publish(self, tenant: Tenant):
+        if self.applying:
+            return
+        value = json.dumps(tenant.monzo_client.dump_tokens())
+        self.submit(PUBLISH, (f"tenant:{tenant.id}", value))
+
+    async def pull(self):
+        rows = await self.query(
+            "SELECT key, value, version FROM kv WHERE version > ? ORDER BY version",
+            (self.version,),
+        )
+        for key, value, version in rows:
+            self.version = version
+            tenant = tenants.get(key.removeprefix("tenant:"))
+            if not tenant:
+                continue
+            client = tenant.monzo_client
+            old_state = client.state
+            self.applying = True
+            try:
+                client.restore_tokens(json.loads(value))
+                client.changed()
+            finally:
+                self.applying = False
+            if old_state != client.state and old_state:
+                tenants.by_state.pop(old_state, None)
+            tenants.index_state(tenant)
+
+    async def sync_cursors(self):
+        changed = []
+        for tenant in tenants:
+            for account_id, (created, id) in tenant.monzo_client.cursors.items():
+                if self.pushed.get((tenant.id, account_id)) == id:
+                    continue
+                created_ms = int(datetime.fromisoformat(created).timestamp() * 1000)
+                changed.append((tenant.id, account_id, created_ms, created, id))
+                self.pushed[(tenant.id, account_id)] = id
+        if changed:
+            await self.call(lambda: self.db.executemany(CURSOR, changed))
+        # only the cursors other workers moved since the last sync
+        rows = await self.query(
+            "SELECT tenant, account_id, created, id, version FROM cursors WHERE version > ? ORDER BY version",
+            (self.cursor_version,),
+        )
+        for tenant_id, account_id, created, id, version in rows:
+            self.cursor_version = version
+            tenant = tenants.get(tenant_id)
+            if tenant:
+                tenant.monzo_client.advance_cursor(account_id, created, id)
+
+    def guard(self, tenant: Tenant):
+        client = tenant.monzo_client
+
+        async def refresh(exchange: Callable[[], Awaitable[bool]]) -> bool:
+            token = client.access_token
+            await self.pull()
+            if client.access_token != token:
+                return True
+            name = f"refresh:{tenant.id}"
+            if await self.acquire(name, 30):
+                try:
+                    return await exchange()
+                finally:
+                    await self.release(name)
+
+            # another worker holds the refresh token, wait for its new tokens instead
+            deadline = time.monotonic() + 30
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.2)
+                await self.pull()
+                if client.access_token != token:
+                    return True
+            return False
+
+        return refresh
+
+    def attach(self):
+        for tenant in tenants:
+            client = tenant.monzo_client
+            client.listeners.append(lambda tenant=tenant: self.publish(tenant))
+            client.refresh_guard = self.guard(tenant)
+
+    async def elect(self):
+        if await self.acquire("leader", self.lease):
+            if not self.leader:
+                logging.info(f"Worker {self.id} is now the leader")
+                self.leading = asyncio.create_task(self.lead())
+        elif self.leader:
+            logging.warning(f"Worker {self.id} lost the leader lease")
+            await self.step_down()
+
+    async def step_down(self):
+        if self.leading:
+            self.leading.cancel()
+            await asyncio.gather(self.leading, return_exceptions=True)
+            self.leading = None
+
+    async def loop(self):
+        while True:
+            try:
+                await self.pull()
+                await self.sync_cursors()
+                await self.elect()
+                if self.leader:
+                    await self.call(self.prune)
+                self.counts = await self.call(self.count)
+            except Exception:
+                logging.exception("Coordinator sync failed")
+            await asyncio.sleep(self.interval)
+
+    async def start(self, lead: Callable[[], Awaitable]):
+        self.lead = lead
+        if not self.enabled:
+            # a single process is always the leader
+            self.leading = asyncio.create_task(lead())
+            return
+        await self.call(self.connect)
+        self.attach()
+        await self.pull()
+        self.task = asyncio.create_task(self.loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        await self.step_down()
+        if self.enabled:
+            await self.sync_cursors()
+            await self.release("leader")
+        self.executor.shutdown()
+
+
+coordinator = Coordinator(env.coordinator_path, env.coordinator_interval)
+
+metrics.gauge(
+    "abd_leader",
+    "Whether this worker runs the background jobs",
+    lambda: int(coordinator.leader),
+)
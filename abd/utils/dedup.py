@@ -0,0 +1,135 @@
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+
+from abd.utils.coordinator import coordinator
+from abd.utils.env import env
+from abd.utils.metrics import metrics
+
+
+ID_PATTERN = re.compile(rb'"id"\s*:\s*"(tx_[0-9A-Za-z]+)"')
+TYPE_PATTERN = re.compile(rb'"type"\s*:\s*"([a-z_.]+)"')
+
+
+def event_key(body: bytes) -> str | None:
+    id = ID_PATTERN.search(body)
+    if not id:
+        return None
+    type = TYPE_PATTERN.search(body)
+    type = type.group(1).decode() if type else ""
+    key = f"{type}:{id.group(1).decode()}"
+    if type != "transaction.created":
+        # a transaction is updated many times, only an identical redelivery is a duplicate
+        key += ":" + hashlib.blake2b(body, digest_size=8).hexdigest()
+    return key
+
+
+class SeenSet:
+    def __init__(self, max_size: int, ttl: float, path: str | None = None) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.seen: OrderedDict[str, float] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lines = 0
+
+        if path:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self.seen)
+
+    async def check(self, key: str) -> bool:
+        now = time.time()
+        seen_at = self.seen.get(key)
+        if seen_at is not None and now - seen_at <= self.ttl:
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        self.seen[key] = now
+        self.seen.move_to_end(key)
+        while len(self.seen) > self.max_size:
+            self.seen.popitem(last=False)
+        if self.path:
+            self.append(key, now)
+        return False
+
+    def forget(self, key: str):
+        self.seen.pop(key, None)
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        cutoff = time.time() - self.ttl
+        with open(self.path) as f:
+            for line in f:
+                self.lines += 1
+                seen_at, _, key = line.rstrip("\n").partition(" ")
+                try:
+                    if float(seen_at) >= cutoff:
+                        self.seen[key] = float(seen_at)
+                        self.seen.move_to_end(key)
+                except ValueError:
+                    continue
+        while len(self.seen) > self.max_size:
+            self.seen.popitem(last=False)
+        logging.info(f"Loaded {len(self.seen)} seen webhook ids")
+
+    def append(self, key: str, seen_at: float):
+        with open(self.path, "a") as f:
+            f.write(f"{seen_at:.0f} {key}\n")
+        self.lines += 1
+        if self.lines > self.max_size * 2:
+            self.compact()
+
+    def compact(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            f.writelines(f"{seen_at:.0f} {key}\n" for key, seen_at in self.seen.items())
+        os.replace(tmp, self.path)
+        self.lines = len(self.seen)
+
+
+class SharedSeenSet:
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return coordinator.counts["seen"]
+
+    async def check(self, key: str) -> bool:
+        if await coordinator.seen(key, self.ttl):
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def forget(self, key: str):
+        coordinator.forget(key)
+
+
+# with several workers a retried webhook can land on any of them
+seen = (
+    SharedSeenSet(ttl=env.dedup_ttl)
+    if coordinator.enabled
+    else SeenSet(
+        max_size=env.dedup_size, ttl=env.dedup_ttl, path=env.dedup_path or None
+    )
+)
+
+metrics.gauge(
+    "abd_dedup_size", "Webhook ids remembered for deduplication", seen.__len__
+)
+metrics.collector(
+    "abd_dedup_total",
+    "Webhooks checked for duplicates by result",
+    "counter",
+    lambda: [("", {"result": "hit"}, seen.hits), ("", {"result": "miss"}, seen.misses)],
+)
@@ -1,10 +1,12 @@
 import os
+from functools import cached_property
+from typing import TYPE_CHECKING
 
 from aiohttp import ClientSession
 from dotenv import load_dotenv
-from slack_sdk.web.async_client import AsyncWebClient
 
-from abd.utils.monzo.handler import MonzoHandler
+if TYPE_CHECKING:
+    from slack_sdk.web.async_client import AsyncWebClient
 
 load_dotenv()
 
@@ -14,13 +16,18 @@ class Environment:
         self.slack_bot_token = os.environ.get("SLACK_BOT_TOKEN", "unset")
         self.slack_signing_secret = os.environ.get("SLACK_SIGNING_SECRET", "unset")
 
-        self.slack_log_channel = os.environ.get("SLACK_LOG_CHANNEL", "unset")
-        self.slack_user_id = os.environ.get("SLACK_USER_ID", "unset")
+        # With a tenants file every user brings their own channel, user and webhook
+        self.tenants_file = os.environ.get("TENANTS_FILE")
+        self.routes_file = os.environ.get("ROUTES_FILE")
+        tenant_default = None if self.tenants_file else "unset"
+
+        self.slack_log_channel = os.environ.get("SLACK_LOG_CHANNEL", tenant_default)
+        self.slack_user_id = os.environ.get("SLACK_USER_ID", tenant_default)
 
         self.monzo_client_id = os.environ.get("MONZO_CLIENT_ID", "unset")
         self.monzo_client_secret = os.environ.get("MONZO_CLIENT_SECRET", "unset")
         self.domain = os.environ.get("DOMAIN", "unset")
-        self.webhook_verif = os.environ.get("WEBHOOK_VERIF", "unset")
+        self.webhook_verif = os.environ.get("WEBHOOK_VERIF", tenant_default)
 
         self.environment = os.environ.get("ENVIRONMENT", "development")
 
@@ -28,21 +35,96 @@ class Environment:
         self.logging = True if os.environ.get("LOGGING") else False
 
         self.slack_heartbeat_channel = os.environ.get("SLACK_HEARTBEAT_CHANNEL")
+        self.heartbeat_sample_rate = float(os.environ.get("HEARTBEAT_SAMPLE_RATE", 1))
+        self.heartbeat_max_chars = int(os.environ.get("HEARTBEAT_MAX_CHARS", 1500))
+        self.heartbeat_max_backlog = int(os.environ.get("HEARTBEAT_MAX_BACKLOG", 20))
+        self.log_format = os.environ.get("LOG_FORMAT", "json")
+        self.log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+
+        self.webhook_workers = int(os.environ.get("WEBHOOK_WORKERS", 4))
+        self.webhook_queue_size = int(os.environ.get("WEBHOOK_QUEUE_SIZE", 1000))
+        self.webhook_shed_depth = int(
+            os.environ.get("WEBHOOK_SHED_DEPTH", self.webhook_queue_size * 0.8)
+        )
+        self.webhook_max_body = int(os.environ.get("WEBHOOK_MAX_BODY", 64 * 1024))
+        self.webhook_source_rate = float(os.environ.get("WEBHOOK_SOURCE_RATE", 50))
+        self.webhook_source_burst = float(os.environ.get("WEBHOOK_SOURCE_BURST", 100))
+        self.rejection_report_interval = float(
+            os.environ.get("REJECTION_REPORT_INTERVAL", 60)
+        )
+        self.pot_cache_ttl = float(os.environ.get("POT_CACHE_TTL", 600))
+        self.pot_cache_size = int(os.environ.get("POT_CACHE_SIZE", 256))
+        self.monzo_api_url = os.environ.get("MONZO_API_URL", "https://api.monzo.com")
+        self.slack_api_url = os.environ.get("SLACK_API_URL", "https://slack.com/api/")
+        self.monzo_rate = float(os.environ.get("MONZO_RATE", 5))
+        self.monzo_burst = float(os.environ.get("MONZO_BURST", 10))
+        self.monzo_timeout = float(os.environ.get("MONZO_TIMEOUT", 30))
+        self.monzo_max_retries = int(os.environ.get("MONZO_MAX_RETRIES", 3))
+        self.token_refresh_margin = float(os.environ.get("TOKEN_REFRESH_MARGIN", 300))
+        self.slack_channel_rate = float(os.environ.get("SLACK_CHANNEL_RATE", 1))
+        self.slack_channel_burst = float(os.environ.get("SLACK_CHANNEL_BURST", 3))
+        self.slack_concurrency = int(os.environ.get("SLACK_CONCURRENCY", 4))
+        self.dedup_size = int(os.environ.get("DEDUP_SIZE", 10000))
+        self.dedup_ttl = float(os.environ.get("DEDUP_TTL", 7 * 24 * 60 * 60))
+        self.dedup_path = os.environ.get("DEDUP_PATH")
+        self.message_index_size = int(os.environ.get("MESSAGE_INDEX_SIZE", 10000))
+        self.update_window = float(os.environ.get("UPDATE_WINDOW", 2))
+        self.coalesce_window = float(os.environ.get("COALESCE_WINDOW", 2))
+        self.health_interval = float(os.environ.get("HEALTH_INTERVAL", 60))
+        self.shutdown_timeout = float(os.environ.get("SHUTDOWN_TIMEOUT", 30))
+        self.backfill = os.environ.get("BACKFILL", "1") != "0"
+        self.backfill_page_size = int(os.environ.get("BACKFILL_PAGE_SIZE", 100))
+        self.backfill_summary_threshold = int(
+            os.environ.get("BACKFILL_SUMMARY_THRESHOLD", 20)
+        )
+        self.ledger_path = os.environ.get("LEDGER_PATH")
+        self.timezone = os.environ.get("TIMEZONE", "Europe/London")
+        self.aggregate_days = int(os.environ.get("AGGREGATE_DAYS", 400))
+        self.http_limit = int(os.environ.get("HTTP_LIMIT", 100))
+        self.http_limit_per_host = int(os.environ.get("HTTP_LIMIT_PER_HOST", 20))
+        self.http_dns_ttl = int(os.environ.get("HTTP_DNS_TTL", 300))
+        self.http_keepalive = float(os.environ.get("HTTP_KEEPALIVE", 60))
+        self.http_timeout = float(os.environ.get("HTTP_TIMEOUT", 30))
+        self.http_connect_timeout = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 10))
+        self.breaker_threshold = int(os.environ.get("BREAKER_THRESHOLD", 5))
+        self.breaker_reset = float(os.environ.get("BREAKER_RESET", 30))
+        self.outbox_path = os.environ.get("OUTBOX_PATH")
+        self.outbox_drain_rate = float(os.environ.get("OUTBOX_DRAIN_RATE", 5))
+        self.outbox_lease = float(os.environ.get("OUTBOX_LEASE", 60))
+        self.outbox_max_attempts = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 20))
+        self.workers = int(os.environ.get("WORKERS", 1))
+        self.coordinator_path = os.environ.get("COORDINATOR_PATH")
+        self.coordinator_interval = float(os.environ.get("COORDINATOR_INTERVAL", 1))
+        if self.workers > 1 and not self.coordinator_path:
+            raise ValueError(
+                "COORDINATOR_PATH is required when running several WORKERS"
+            )
+        self.state_path = os.environ.get("STATE_PATH")
+        self.state_key = os.environ.get("STATE_KEY")
+        self.state_interval = float(os.environ.get("STATE_INTERVAL", 300))
 
         unset = [key for key, value in self.__dict__.items() if value == "unset"]
 
         if unset:
             raise ValueError(f"Missing environment variables: {', '.join(unset)}")
 
-        self.session: ClientSession
+        self.session: ClientSession | None = None
+
+    @cached_property
+    def slack_client(self) -> "AsyncWebClient":
+        # slack_sdk is slow to import, so only pay for it once something talks to Slack
+        from slack_sdk.web.async_client import AsyncWebClient
 
-        self.monzo_client = MonzoHandler(
-            client_id=self.monzo_client_id,
-            client_secret=self.monzo_client_secret,
-            domain=self.domain,
-            webhook_verification=self.webhook_verif,
+        return AsyncWebClient(
+            token=self.slack_bot_token,
+            base_url=self.slack_api_url,
+            session=self.session,
         )
-        self.slack_client = AsyncWebClient(token=self.slack_bot_token)
+
+    def use_session(self, session: ClientSession):
+        self.session = session
+        if "slack_client" in self.__dict__:
+            self.slack_client.session = session
 
 
 env = Environment()
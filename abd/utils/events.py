@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable
+from typing import TypeVar
+
+from abd.utils.aggregates import aggregates
+from abd.utils.coalescer import bursts
+from abd.utils.coalescer import updates
+from abd.utils.ledger import ledger
+from abd.utils.logging import firehose
+from abd.utils.messages import decode_lines
+from abd.utils.messages import encode_lines
+from abd.utils.messages import messages
+from abd.utils.metrics import pot_lookup
+from abd.utils.metrics import render_time
+from abd.utils.monzo.render import render
+from abd.utils.monzo.render import Transaction
+from abd.utils.monzo.types import TransactionData
+from abd.utils.monzo.types import TransactionSchemes
+from abd.utils.monzo.types import WebhookEvent
+from abd.utils.outbox import outbox
+from abd.utils.routing import router
+from abd.utils.scheduler import scheduler
+from abd.utils.tenants import Tenant
+
+T = TypeVar("T")
+
+
+def record(tenant: Tenant, data: TransactionData):
+    tenant.monzo_client.advance_cursor(data.account_id, data.created, data.id)
+    ledger.record(tenant.id, data)
+    aggregates.add_transaction(tenant.id, data)
+
+
+async def render_transaction(tenant: Tenant, data: TransactionData) -> Transaction:
+    pot = None
+    if (
+        data.scheme == TransactionSchemes.PotTransfer.value
+        and data.metadata
+        and data.metadata.pot_id
+    ):
+        started = time.perf_counter()
+        pot = await tenant.monzo_client.get_pot(data.metadata.pot_id, data.account_id)
+        pot_lookup.observe(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    transaction = render(data, tenant.slack_user_id, pot)
+    render_time.observe(time.perf_counter() - started)
+    return transaction
+
+
+# schemes that arrive in bursts: a card payment and its round-ups or pot sweeps, or a split bill
+BURSTS = {
+    TransactionSchemes.Mastercard.value: "card",
+    TransactionSchemes.PotTransfer.value: "pot",
+    TransactionSchemes.P2PPayment.value: "p2p",
+}
+# the newest card payment on each account, which the next pot transfers belong to
+cards: dict[tuple[str, str], str] = {}
+
+
+def pot_id(data: TransactionData) -> str | None:
+    if data.scheme == TransactionSchemes.PotTransfer.value and data.metadata:
+        return data.metadata.pot_id
+    return None
+
+
+def burst_key(tenant: Tenant, data: TransactionData) -> tuple | None:
+    account = (tenant.id, data.account_id)
+    match BURSTS.get(data.scheme):
+        case "card":
+            # card payments are never combined with each other, only with what they set off
+            cards[account] = data.id
+            return (*account, data.id)
+        case "pot":
+            card = (*account, cards.get(account))
+            if card in bursts.batches:
+                return card
+            return (*account, "pot", pot_id(data))
+        case "p2p":
+            return (*account, "p2p")
+    return None
+
+
+def burst_wait(data: TransactionData) -> float:
+    # the window starts when Monzo created the transaction, time spent reaching us counts towards it
+    if not data.created:
+        return bursts.window
+    age = time.time() - datetime.fromisoformat(data.created).timestamp()
+    return min(bursts.window, max(0.0, bursts.window - age))
+
+
+async def render_batch(
+    tenant: Tenant, batch: list[TransactionData]
+) -> tuple[list[Transaction], list[tuple[list[str], str]]]:
+    # transfers into the same pot (round-ups, sweeps) share a line and a pot lookup
+    groups: dict[str, list[TransactionData]] = {}
+    for data in batch:
+        groups.setdefault(pot_id(data) or data.id, []).append(data)
+
+    transactions = []
+    lines = []
+    for group in groups.values():
+        data = group[0]
+        if len(group) > 1:
+            data = data.model_copy(
+                update={
+                    "amount": sum(d.amount for d in group),
+                    "local_amount": sum(d.local_amount for d in group),
+                }
+            )
+        transaction = await render_transaction(tenant, data)
+        line = transaction.sentence
+        if len(group) > 1:
+            line += f" ({len(group)} transfers)"
+        transactions.append(transaction)
+        lines.append(([d.id for d in group], line))
+    return transactions, lines
+
+
+async def remember(channel: str, ts: str, lines: list[tuple[list[str], str]]):
+    # every transaction in the message can be found, each knowing which line is its own.
+    # Slack already has the message, so failing here mustn't count as a failed delivery
+    encoded = encode_lines(lines)
+    try:
+        for ids, _line in lines:
+            for tx_id in ids:
+                await messages.put(tx_id, channel, ts, encoded)
+    except Exception:
+        logging.exception(f"Failed to remember Slack message {ts} for later edits")
+
+
+def routes(tenant: Tenant, transactions: list[Transaction]) -> list[str]:
+    channels = []
+    for transaction in transactions:
+        for channel in router.route(tenant.id, transaction):
+            if channel != tenant.log_channel and channel not in channels:
+                channels.append(channel)
+    return channels
+
+
+def copied(future: asyncio.Future):
+    if not future.cancelled() and future.exception():
+        logging.error("Failed to post a routed copy", exc_info=future.exception())
+
+
+async def deliver(entries: list[int | None], send: Awaitable[T]) -> T | None:
+    try:
+        result = await send
+    except Exception:
+        # with an outbox the event is kept for a later attempt, without one it fails as before
+        if not outbox.enabled:
+            raise
+        logging.exception("Delivery failed, keeping the event in the outbox")
+        outbox.retry(*entries)
+        return None
+    outbox.complete(*entries)
+    return result
+
+
+async def send_batch(
+    tenant: Tenant, batch: list[TransactionData]
+) -> tuple[list[Transaction], list[tuple[list[str], str]], dict]:
+    transactions, lines = await render_batch(tenant, batch)
+    lead = transactions[0]
+    res = await scheduler.send(
+        text="\n".join(line for _ids, line in lines),
+        channel=tenant.log_channel,
+        icon_url=lead.icon,
+        username=lead.name,
+    )
+    return transactions, lines, res
+
+
+async def post(tenant: Tenant, batch: list[tuple[TransactionData, int | None]]):
+    batch_data = [data for data, _entry in batch]
+    try:
+        sent = await deliver(
+            [entry for _data, entry in batch], send_batch(tenant, batch_data)
+        )
+        if sent is None:
+            return
+        transactions, lines, res = sent
+        await remember(res["channel"], res["ts"], lines)
+    finally:
+        for data in batch_data:
+            messages.settle(data.id)
+
+    lead = transactions[0]
+    text = "\n".join(line for _ids, line in lines)
+    # copies for the channels picked by routing rules, only the log channel's message is edited later
+    for channel in routes(tenant, transactions):
+        router.routed += 1
+        scheduler.submit(
+            text=text, channel=channel, icon_url=lead.icon, username=lead.name
+        ).add_done_callback(copied)
+    for data in batch_data:
+        record(tenant, data)
+    firehose.send(text, batch_data)
+
+
+async def apply_update(tenant: Tenant, data: TransactionData):
+    message = await messages.find(data.id)
+    if not message:
+        logging.info(f"No Slack message to update for {data.id}")
+        return
+    channel, ts, _lines = message
+
+    async with messages.lock(ts):
+        # another line of the message may have been edited while this one waited
+        message = await messages.get(data.id)
+        if not message:
+            return
+        channel, ts, lines = message
+        lines = decode_lines(lines)
+        index = next(i for i, (ids, _line) in enumerate(lines) if data.id in ids)
+        if len(lines[index][0]) > 1:
+            logging.info(f"Not editing {data.id}, its line adds up several transfers")
+            return
+
+        transaction = await render_transaction(tenant, data)
+        if transaction.sentence == lines[index][1]:
+            return
+        lines[index][1] = transaction.sentence
+        text = "\n".join(line for _ids, line in lines)
+        await scheduler.send("chat_update", channel=channel, ts=ts, text=text)
+        await remember(channel, ts, lines)
+
+
+async def edit_message(tenant: Tenant, batch: list[tuple[TransactionData, int | None]]):
+    # only the newest update is applied, but it settles every one it replaced
+    data = batch[-1][0]
+    await deliver([entry for _data, entry in batch], apply_update(tenant, data))
+
+
+async def handle_event(
+    tenant: Tenant, res: WebhookEvent, entry: int | None = None, live: bool = False
+):
+    try:
+        await dispatch(tenant, res, entry, live)
+    except Exception:
+        # give the entry back so it's replayed rather than held until a restart
+        outbox.retry(entry)
+        raise
+
+
+async def dispatch(tenant: Tenant, res: WebhookEvent, entry: int | None, live: bool):
+    type = res.type
+    data = res.data
+
+    match type:
+        case "transaction.created":
+            if data.decline_reason:
+                firehose.send(f"Transaction declined for {data.decline_reason}", [data])
+                record(tenant, data)
+                outbox.complete(entry)
+                return
+
+            if (
+                data.scheme == TransactionSchemes.Mastercard.value
+                and data.notes == "Active card check"
+            ):
+                outbox.complete(entry)
+                return
+
+            messages.expect(data.id)
+            # only webhooks arriving as they happen are bursts, backfill and replays
+            # bring in old events quickly and are posted one at a time
+            key = burst_key(tenant, data) if live and bursts.enabled else None
+            wait = burst_wait(data) if key else 0
+            if key and (key in bursts.batches or wait > 0):
+                bursts.add(key, (data, entry), lambda batch: post(tenant, batch), wait)
+            else:
+                await post(tenant, [(data, entry)])
+        case "transaction.updated":
+            # settlement and merchant enrichment edit the original message instead of posting again
+            if data.decline_reason:
+                outbox.complete(entry)
+                return
+            updates.add(
+                data.id, (data, entry), lambda batch: edit_message(tenant, batch)
+            )
+        case _:
+            firehose.send(f"Unhandled webhook type: {type}", [data])
+            outbox.complete(entry)
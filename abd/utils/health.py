@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from typing import Callable
+
+from abd.utils.env import env
+from abd.utils.tenants import Tenant
+from abd.utils.tenants import tenants
+
+
+class HealthProber:
+    def __init__(self, interval: float, concurrency: int = 10) -> None:
+        self.interval = interval
+        self.concurrency = concurrency
+        self.monzo = False
+        self.slack = False
+        self.unauthorised: list[str] = []
+        self.checked_at: float | None = None
+        self.last_error: str | None = None
+        self.last_error_at: float | None = None
+        self.task: asyncio.Task | None = None
+        self.probing: asyncio.Task | None = None
+        # sizes that need a query are counted once per probe rather than per request
+        self.counters: dict[str, Callable[[], int]] = {}
+        self.sizes: dict[str, int] = {}
+
+    def count(self, name: str, counter: Callable[[], int]):
+        self.counters[name] = counter
+
+    def error(self, message: str):
+        self.last_error = message
+        self.last_error_at = time.time()
+        logging.warning(f"Health check failed: {message}")
+
+    async def check_monzo(self) -> bool:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def check(tenant: Tenant) -> bool:
+            async with semaphore:
+                return await tenant.monzo_client.test_auth()
+
+        results = await asyncio.gather(
+            *(check(tenant) for tenant in tenants), return_exceptions=True
+        )
+        self.unauthorised = [
+            tenant.id for tenant, ok in zip(tenants, results) if ok is not True
+        ]
+        if self.unauthorised:
+            self.error(f"Monzo unauthorised for {len(self.unauthorised)} tenant(s)")
+        return not self.unauthorised
+
+    async def check_slack(self) -> bool:
+        try:
+            await env.slack_client.api_test()
+            return True
+        except Exception as e:
+            self.error(f"Slack: {e}")
+            return False
+
+    async def probe(self):
+        # share one probe between the background loop and concurrent deep checks
+        if not self.probing:
+            self.probing = asyncio.create_task(self.run_probe())
+        await asyncio.shield(self.probing)
+
+    async def run_probe(self):
+        try:
+            self.monzo, self.slack = await asyncio.gather(
+                self.check_monzo(), self.check_slack()
+            )
+            for name, counter in self.counters.items():
+                try:
+                    self.sizes[name] = counter()
+                except Exception as e:
+                    self.error(f"Counting {name}: {e}")
+            self.checked_at = time.time()
+        finally:
+            self.probing = None
+
+    async def loop(self):
+        while True:
+            try:
+                await self.probe()
+            except Exception as e:
+                self.error(str(e))
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.task = asyncio.create_task(self.loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    def report(self) -> dict:
+        staleness = time.time() - self.checked_at if self.checked_at else None
+        stale = staleness is None or staleness > self.interval * 3
+        return {
+            "healthy": self.monzo and self.slack and not stale,
+            "monzo": self.monzo,
+            "slack": self.slack,
+            "checked_at": self.checked_at,
+            "staleness": staleness,
+            "stale": stale,
+            "unauthorised": self.unauthorised[:20],
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+        }
+
+
+prober = HealthProber(interval=env.health_interval)
@@ -0,0 +1,74 @@
+from aiohttp import ClientSession
+from aiohttp import ClientTimeout
+from aiohttp import TCPConnector
+from aiohttp import TraceConfig
+
+from abd.utils.env import env
+from abd.utils.metrics import metrics
+
+
+class ConnectionStats:
+    def __init__(self) -> None:
+        self.created = 0
+        self.reused = 0
+        self.dns_hits = 0
+        self.dns_misses = 0
+
+    def trace_config(self) -> TraceConfig:
+        config = TraceConfig()
+
+        async def created(_session, _ctx, _params):
+            self.created += 1
+
+        async def reused(_session, _ctx, _params):
+            self.reused += 1
+
+        async def dns_hit(_session, _ctx, _params):
+            self.dns_hits += 1
+
+        async def dns_miss(_session, _ctx, _params):
+            self.dns_misses += 1
+
+        config.on_connection_create_end.append(created)
+        config.on_connection_reuseconn.append(reused)
+        config.on_dns_cache_hit.append(dns_hit)
+        config.on_dns_cache_miss.append(dns_miss)
+        return config
+
+
+stats = ConnectionStats()
+
+
+def create_session() -> ClientSession:
+    # one keep-alive pool for Monzo and Slack so messages don't each pay for a TLS handshake
+    connector = TCPConnector(
+        limit=env.http_limit,
+        limit_per_host=env.http_limit_per_host,
+        ttl_dns_cache=env.http_dns_ttl,
+        keepalive_timeout=env.http_keepalive,
+    )
+    return ClientSession(
+        connector=connector,
+        timeout=ClientTimeout(total=env.http_timeout, connect=env.http_connect_timeout),
+        trace_configs=[stats.trace_config()],
+    )
+
+
+metrics.collector(
+    "abd_http_connections_total",
+    "Outgoing HTTP connections by whether they were opened or reused from the pool",
+    "counter",
+    lambda: [
+        ("", {"result": "created"}, stats.created),
+        ("", {"result": "reused"}, stats.reused),
+    ],
+)
+metrics.collector(
+    "abd_http_dns_cache_total",
+    "DNS lookups by whether they were served from the cache",
+    "counter",
+    lambda: [
+        ("", {"result": "hit"}, stats.dns_hits),
+        ("", {"result": "miss"}, stats.dns_misses),
+    ],
+)
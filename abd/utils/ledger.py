@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+
+from abd.utils.env import env
+from abd.utils.metrics import metrics
+from abd.utils.monzo.types import TransactionData
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    tenant TEXT NOT NULL,
+    account_id TEXT NOT NULL,
+    created INTEGER NOT NULL,
+    scheme TEXT NOT NULL,
+    category TEXT,
+    amount INTEGER NOT NULL,
+    currency TEXT NOT NULL,
+    local_amount INTEGER NOT NULL,
+    local_currency TEXT NOT NULL,
+    merchant_id TEXT,
+    merchant_name TEXT,
+    pot_id TEXT,
+    declined INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_created ON transactions (tenant, created);
+CREATE INDEX IF NOT EXISTS transactions_scheme ON transactions (tenant, scheme, created);
+CREATE INDEX IF NOT EXISTS transactions_category ON transactions (tenant, category, created);
+CREATE INDEX IF NOT EXISTS transactions_merchant ON transactions (tenant, merchant_id, created);
+CREATE INDEX IF NOT EXISTS transactions_pot ON transactions (tenant, pot_id, created);
+"""
+
+INSERT = "INSERT OR IGNORE INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+FILTERS = ("scheme", "category", "merchant_id", "pot_id")
+
+Row = tuple
+
+
+def to_millis(created: str | None) -> int:
+    when = datetime.fromisoformat(created) if created else datetime.now().astimezone()
+    return int(when.timestamp() * 1000)
+
+
+def to_row(tenant: str, data: TransactionData) -> Row:
+    merchant = data.merchant
+    return (
+        data.id,
+        tenant,
+        data.account_id,
+        to_millis(data.created),
+        data.scheme,
+        data.category,
+        data.amount,
+        data.currency,
+        data.local_amount,
+        data.local_currency,
+        merchant.id if merchant else None,
+        merchant.name if merchant else None,
+        data.metadata.pot_id if data.metadata else None,
+        1 if data.decline_reason else 0,
+    )
+
+
+class Ledger:
+    def __init__(self, path: str | None, batch_size: int = 500) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.pending: queue.SimpleQueue[Row | None] = queue.SimpleQueue()
+        self.writer: threading.Thread | None = None
+        self.readers = threading.local()
+        self.written = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def start(self):
+        if not self.enabled or self.writer:
+            return
+        db = self.connect()
+        db.executescript(SCHEMA)
+        db.close()
+        self.writer = threading.Thread(target=self.write, name="ledger", daemon=True)
+        self.writer.start()
+
+    def write(self):
+        db = self.connect()
+        stopping = False
+        while not stopping:
+            # block for the first row, then take whatever else has queued up as one transaction
+            batch = [self.pending.get()]
+            while len(batch) < self.batch_size and not self.pending.empty():
+                batch.append(self.pending.get())
+            if None in batch:
+                stopping = True
+                batch = [row for row in batch if row is not None]
+            try:
+                with db:
+                    db.executemany(INSERT, batch)
+                self.written += len(batch)
+            except sqlite3.Error:
+                self.failed += len(batch)
+                logging.exception(f"Failed to write {len(batch)} rows to the ledger")
+        db.close()
+
+    def record(self, tenant: str, data: TransactionData):
+        if self.writer:
+            self.pending.put(to_row(tenant, data))
+
+    async def stop(self):
+        if self.writer:
+            self.pending.put(None)
+            await asyncio.to_thread(self.writer.join)
+            self.writer = None
+
+    def reader(self) -> sqlite3.Connection:
+        db = getattr(self.readers, "db", None)
+        if db is None:
+            db = self.readers.db = self.connect()
+            db.execute("PRAGMA query_only=ON")
+        return db
+
+    async def query(self, sql: str, params: tuple = ()) -> list[Row]:
+        return await asyncio.to_thread(
+            lambda: self.reader().execute(sql, params).fetchall()
+        )
+
+    async def transactions(
+        self,
+        tenant: str,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        limit: int = 100,
+        **filters: str,
+    ) -> list[Row]:
+        clauses = ["tenant = ?"]
+        params: list = [tenant]
+        if since:
+            clauses.append("created >= ?")
+            params.append(int(since.timestamp() * 1000))
+        if until:
+            clauses.append("created < ?")
+            params.append(int(until.timestamp() * 1000))
+        for column, value in filters.items():
+            if column not in FILTERS:
+                raise ValueError(f"Can't filter the ledger by {column}")
+            clauses.append(f"{column} = ?")
+            params.append(value)
+        sql = f"SELECT * FROM transactions WHERE {' AND '.join(clauses)} ORDER BY created DESC LIMIT ?"
+        return await self.query(sql, (*params, limit))
+
+
+ledger = Ledger(env.ledger_path)
+
+metrics.gauge(
+    "abd_ledger_pending",
+    "Transactions waiting to be written to the ledger",
+    ledger.pending.qsize,
+)
+metrics.collector(
+    "abd_ledger_writes_total",
+    "Transactions written to the ledger by result",
+    "counter",
+    lambda: [
+        ("", {"result": "ok"}, ledger.written),
+        ("", {"result": "failed"}, ledger.failed),
+    ],
+)
@@ -1,17 +1,146 @@
+import asyncio
+import atexit
+import copy
+import json
+import logging
+import random
+import sys
+from datetime import datetime
+from datetime import timezone
+from logging.handlers import QueueHandler
+from logging.handlers import QueueListener
+from queue import SimpleQueue
+
+from pydantic import BaseModel
+
 from abd.utils.env import env
+from abd.utils.metrics import metrics
+from abd.utils.scheduler import HEARTBEAT
+from abd.utils.scheduler import scheduler
+
+RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "color_message"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        # anything passed through extra= becomes a field of its own
+        for key, value in vars(record).items():
+            if key not in RESERVED:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class StructuredQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # only resolve what can't safely cross to the writer thread, the rest is formatted there
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging():
+    # writing to stdout happens on a background thread so it never blocks the event loop
+    handler = logging.StreamHandler(sys.stdout)
+    if env.log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+    queue = SimpleQueue()
+    listener = QueueListener(queue, handler)
+
+    root = logging.getLogger()
+    root.handlers = [StructuredQueueHandler(queue)]
+    root.setLevel(env.log_level)
+    # uvicorn may have given its loggers their own stdout handlers already
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).propagate = True
+
+    listener.start()
+    atexit.register(listener.stop)
+
+
+def truncate(text: str, limit: int | None = None) -> str:
+    limit = limit or env.heartbeat_max_chars
+    return text if len(text) <= limit else text[: limit - 1] + "…"
 
 
 async def send_heartbeat(heartbeat: str, messages: list[str] = []):
     if env.slack_heartbeat_channel:
         heartbeat = heartbeat.replace("<@", "@")
         heartbeat = heartbeat.replace(">", "")
-        msg = await env.slack_client.chat_postMessage(
-            channel=env.slack_heartbeat_channel, text=heartbeat
+        msg = await scheduler.send(
+            priority=HEARTBEAT, channel=env.slack_heartbeat_channel, text=heartbeat
         )
         if messages:
-            for message in messages:
-                await env.slack_client.chat_postMessage(
-                    channel=env.slack_heartbeat_channel,
-                    text=message,
-                    thread_ts=msg["ts"],
+            await asyncio.gather(
+                *(
+                    scheduler.submit(
+                        priority=HEARTBEAT,
+                        channel=env.slack_heartbeat_channel,
+                        text=message,
+                        thread_ts=msg["ts"],
+                    )
+                    for message in messages
                 )
+            )
+
+
+class Firehose:
+    def __init__(self, sample_rate: float, max_backlog: int) -> None:
+        self.sample_rate = sample_rate
+        self.max_backlog = max_backlog
+        self.tasks: set[asyncio.Task] = set()
+        self.counts = {"sent": 0, "sampled_out": 0, "dropped": 0}
+
+    def send(self, heartbeat: str, details: list[BaseModel] = []):
+        # per-transaction debug output, sampled and never awaited by the event handlers
+        if not env.slack_heartbeat_channel:
+            return
+        if random.random() >= self.sample_rate:
+            self.counts["sampled_out"] += 1
+            return
+        channel = scheduler.channels.get(env.slack_heartbeat_channel)
+        if channel and len(channel.pending) >= self.max_backlog:
+            self.counts["dropped"] += 1
+            return
+
+        self.counts["sent"] += 1
+        messages = [
+            f"```{truncate(detail.model_dump_json(exclude_none=True))}```"
+            for detail in details
+        ]
+        task = asyncio.create_task(send_heartbeat(truncate(heartbeat), messages))
+        self.tasks.add(task)
+        task.add_done_callback(self.done)
+
+    def done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logging.error("Failed to send heartbeat", exc_info=task.exception())
+
+
+firehose = Firehose(env.heartbeat_sample_rate, env.heartbeat_max_backlog)
+
+metrics.collector(
+    "abd_heartbeats_total",
+    "Per-transaction heartbeats by whether they were sent, sampled out or dropped under load",
+    "counter",
+    lambda: [
+        ("", {"result": result}, count) for result, count in firehose.counts.items()
+    ],
+)
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import weakref
+from collections import OrderedDict
+
+from abd.utils.coordinator import coordinator
+from abd.utils.env import env
+from abd.utils.metrics import metrics
+
+
+def encode_lines(lines: list[tuple[list[str], str]]) -> str:
+    return json.dumps(lines, separators=(",", ":"))
+
+
+def decode_lines(lines: str) -> list[list]:
+    return json.loads(lines)
+
+
+class MessageIndex:
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        # transaction id -> (channel, ts, the message's lines as JSON [[transaction ids, line], ...])
+        self.messages: OrderedDict[str, tuple[str, str, str]] = OrderedDict()
+        self.posting: dict[str, asyncio.Event] = {}
+        self.locks: weakref.WeakValueDictionary[str, asyncio.Lock] = (
+            weakref.WeakValueDictionary()
+        )
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    async def get(self, tx_id: str) -> tuple[str, str, str] | None:
+        return self.messages.get(tx_id)
+
+    async def put(self, tx_id: str, channel: str, ts: str, lines: str):
+        self.store(tx_id, channel, ts, lines)
+
+    def store(self, tx_id: str, channel: str, ts: str, lines: str):
+        self.messages[tx_id] = (channel, ts, lines)
+        self.messages.move_to_end(tx_id)
+        while len(self.messages) > self.max_size:
+            self.messages.popitem(last=False)
+
+    def expect(self, tx_id: str):
+        self.posting.setdefault(tx_id, asyncio.Event())
+
+    def settle(self, tx_id: str):
+        event = self.posting.pop(tx_id, None)
+        if event:
+            event.set()
+
+    def lock(self, ts: str) -> asyncio.Lock:
+        # edits to different lines of one message must not overwrite each other
+        lock = self.locks.get(ts)
+        if not lock:
+            lock = self.locks[ts] = asyncio.Lock()
+        return lock
+
+    async def find(self, tx_id: str) -> tuple[str, str, str] | None:
+        # an update can overtake the post for its own transaction
+        event = self.posting.get(tx_id)
+        if event:
+            await event.wait()
+        return await self.get(tx_id)
+
+    def dump(self) -> list:
+        return [[tx_id, *message] for tx_id, message in self.messages.items()]
+
+    def restore(self, data: list):
+        for entry in data:
+            # snapshots from before messages kept their lines can't be edited
+            if len(entry) == 4:
+                self.store(*entry)
+
+
+class SharedMessageIndex(MessageIndex):
+    def __len__(self) -> int:
+        return coordinator.counts["messages"]
+
+    async def get(self, tx_id: str) -> tuple[str, str, str] | None:
+        return await coordinator.message(tx_id)
+
+    async def put(self, tx_id: str, channel: str, ts: str, lines: str):
+        await coordinator.put_message(tx_id, channel, ts, lines)
+
+    def dump(self) -> list:
+        return []
+
+
+# with several workers the update can land on a different worker than the post
+messages = (
+    SharedMessageIndex(env.message_index_size)
+    if coordinator.enabled
+    else MessageIndex(env.message_index_size)
+)
+
+metrics.gauge(
+    "abd_message_index_size",
+    "Posted transactions that can still be edited in place",
+    messages.__len__,
+)
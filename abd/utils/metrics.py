@@ -0,0 +1,128 @@
+from bisect import bisect_left
+from typing import Callable
+from typing import Iterable
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+Sample = tuple[str, dict[str, str], float]
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{escape(value)}"' for key, value in labels.items())
+    return f"{{{pairs}}}"
+
+
+class Histogram:
+    __slots__ = ("name", "help", "buckets", "counts", "sum", "count")
+
+    def __init__(self, name: str, help: str, buckets: tuple = BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {total}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class Counter:
+    __slots__ = ("name", "help", "value")
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} counter",
+            f"{self.name} {self.value}",
+        ]
+
+
+class Collector:
+    __slots__ = ("name", "help", "type", "collect")
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        type: str,
+        collect: Callable[[], Iterable[Sample]],
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.type = type
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.collect():
+            lines.append(f"{self.name}{suffix}{format_labels(labels)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, Histogram | Counter | Collector] = {}
+
+    def histogram(self, name: str, help: str, buckets: tuple = BUCKETS) -> Histogram:
+        metric = self.metrics[name] = Histogram(name, help, buckets)
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        metric = self.metrics[name] = Counter(name, help)
+        return metric
+
+    def gauge(self, name: str, help: str, value: Callable[[], float]):
+        self.metrics[name] = Collector(name, help, "gauge", lambda: [("", {}, value())])
+
+    def collector(
+        self, name: str, help: str, type: str, collect: Callable[[], Iterable[Sample]]
+    ):
+        self.metrics[name] = Collector(name, help, type, collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = Registry()
+
+webhook_parse = metrics.histogram(
+    "abd_webhook_parse_seconds", "Time spent decoding webhook bodies"
+)
+pot_lookup = metrics.histogram(
+    "abd_pot_lookup_seconds", "Time spent looking up pots for pot transfers"
+)
+render_time = metrics.histogram(
+    "abd_render_seconds", "Time spent rendering transactions"
+)
+slack_post = metrics.histogram("abd_slack_post_seconds", "Duration of Slack API calls")
@@ -0,0 +1,109 @@
+import logging
+from collections import defaultdict
+
+from pydantic import ValidationError
+
+from abd.utils.dedup import seen
+from abd.utils.env import env
+from abd.utils.events import handle_event
+from abd.utils.events import record
+from abd.utils.monzo.render import format_currency
+from abd.utils.monzo.types import MonzoResponse
+from abd.utils.scheduler import scheduler
+from abd.utils.tenants import Tenant
+
+TYPE = "transaction.created"
+
+
+class Summary:
+    def __init__(self) -> None:
+        self.count = 0
+        self.first: str | None = None
+        self.last: str | None = None
+        self.spent: defaultdict[str, int] = defaultdict(int)
+        self.received: defaultdict[str, int] = defaultdict(int)
+
+    def add(self, event: MonzoResponse):
+        data = event.data
+        self.count += 1
+        self.first = self.first or data.created
+        self.last = data.created or self.last
+        if data.decline_reason:
+            return
+        totals = self.spent if data.amount < 0 else self.received
+        totals[data.currency] += data.amount
+
+    def text(self, user: str) -> str:
+        def total(totals: dict[str, int]) -> str:
+            return (
+                ", ".join(format_currency(v, k) for k, v in totals.items()) or "nothing"
+            )
+
+        return (
+            f":rewind: <@{user}> caught up on *{self.count}* missed transactions"
+            f" from {self.first} to {self.last}: spent *{total(self.spent)}*,"
+            f" received *{total(self.received)}*"
+        )
+
+
+async def missed(tenant: Tenant, account_id: str, since: str):
+    async for transaction in tenant.monzo_client.get_transactions(
+        account_id, since, page_size=env.backfill_page_size
+    ):
+        try:
+            event = MonzoResponse.model_validate({"type": TYPE, "data": transaction})
+        except ValidationError as e:
+            logging.warning(f"Skipping unparseable transaction: {e}")
+            continue
+        if await seen.check(f"{TYPE}:{event.data.id}"):
+            continue
+        yield event
+
+
+async def backfill_account(tenant: Tenant, account_id: str) -> int:
+    cursor = tenant.monzo_client.cursors.get(account_id)
+    if not cursor:
+        # nothing handled yet, so there's no gap to fill
+        return 0
+
+    # hold back the first few so a large gap can become one summary instead
+    pending: list[MonzoResponse] = []
+    summary: Summary | None = None
+    async for event in missed(tenant, account_id, cursor[1]):
+        if summary:
+            summary.add(event)
+            record(tenant, event.data)
+        elif len(pending) < env.backfill_summary_threshold:
+            pending.append(event)
+        else:
+            summary = Summary()
+            for held in [*pending, event]:
+                summary.add(held)
+                record(tenant, held.data)
+            pending.clear()
+
+    if summary:
+        await scheduler.send(
+            text=summary.text(tenant.slack_user_id), channel=tenant.log_channel
+        )
+        return summary.count
+
+    # one at a time so the channel's rate limit paces the catch-up
+    for event in pending:
+        await handle_event(tenant, event)
+    return len(pending)
+
+
+async def backfill(tenant: Tenant):
+    if not env.backfill:
+        return
+    for account in await tenant.monzo_client.get_accounts():
+        if account.get("closed"):
+            continue
+        try:
+            count = await backfill_account(tenant, account["id"])
+        except Exception:
+            logging.exception(f"Backfill failed for {tenant.id}")
+            continue
+        if count:
+            logging.info(f"Backfilled {count} transactions for {tenant.id}")
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable
+from typing import Callable
+from typing import Optional
+
+
+class PotCache:
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[list[dict]]],
+        ttl: float = 600,
+        max_accounts: int = 256,
+    ) -> None:
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_accounts = max_accounts
+        self.accounts: OrderedDict[str, tuple[float, dict[str, dict]]] = OrderedDict()
+        self.inflight: dict[str, asyncio.Task] = {}
+
+    def peek(self, pot_id: str, account_id: str) -> Optional[dict]:
+        entry = self.accounts.get(account_id)
+        if not entry or time.monotonic() - entry[0] > self.ttl:
+            return None
+        self.accounts.move_to_end(account_id)
+        return entry[1].get(pot_id)
+
+    async def get(self, pot_id: str, account_id: str) -> Optional[dict]:
+        pot = self.peek(pot_id, account_id)
+        if pot is not None:
+            return pot
+        pots = await self.refresh(account_id)
+        return pots.get(pot_id)
+
+    async def refresh(self, account_id: str) -> dict[str, dict]:
+        # the fetch runs in its own task so a cancelled caller doesn't cancel it for the others
+        task = self.inflight.get(account_id)
+        if not task:
+            task = asyncio.create_task(self.load(account_id))
+            self.inflight[account_id] = task
+            task.add_done_callback(lambda task: self.done(account_id, task))
+        return await asyncio.shield(task)
+
+    def done(self, account_id: str, task: asyncio.Task):
+        self.inflight.pop(account_id, None)
+        # retrieved here too in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def load(self, account_id: str) -> dict[str, dict]:
+        pots = await self.fetch(account_id)
+        index = {pot["id"]: pot for pot in pots if pot.get("id")}
+        # an empty list usually means the fetch failed, so keep serving stale pots
+        if index or account_id not in self.accounts:
+            self.store(account_id, index)
+        else:
+            index = self.accounts[account_id][1]
+        return index
+
+    def dump(self) -> dict[str, dict]:
+        offset = time.time() - time.monotonic()
+        return {
+            account_id: {
+                "fetched_at": fetched_at + offset,
+                "pots": list(index.values()),
+            }
+            for account_id, (fetched_at, index) in self.accounts.items()
+        }
+
+    def restore(self, accounts: dict[str, dict]):
+        offset = time.time() - time.monotonic()
+        for account_id, entry in accounts.items():
+            index = {pot["id"]: pot for pot in entry["pots"] if pot.get("id")}
+            self.store(account_id, index, entry["fetched_at"] - offset)
+
+    def store(
+        self, account_id: str, index: dict[str, dict], fetched_at: float | None = None
+    ):
+        self.accounts[account_id] = (
+            time.monotonic() if fetched_at is None else fetched_at,
+            index,
+        )
+        self.accounts.move_to_end(account_id)
+        while len(self.accounts) > self.max_accounts:
+            self.accounts.popitem(last=False)
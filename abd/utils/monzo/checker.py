@@ -1,23 +1,48 @@
 import asyncio
+import logging
 
-from abd.utils.env import env
+from abd.utils.monzo.backfill import backfill
+from abd.utils.scheduler import DM
+from abd.utils.scheduler import scheduler
+from abd.utils.tenants import Tenant
+from abd.utils.tenants import tenants
 
 
-async def test_auth():
+async def test_auth(tenant: Tenant):
+    monzo_client = tenant.monzo_client
+    gap = True
     while True:
-        auth = await env.monzo_client.test_auth()
-        while not auth:
-            await env.slack_client.chat_postMessage(
-                channel=env.slack_user_id,
-                text=f":x: Monzo authentication failed. Please re-authenticate <{env.monzo_client.generate_monzo_url()}|here>.",
-            )
-            await asyncio.sleep(100)
-            auth = await env.monzo_client.test_auth()
+        try:
+            auth = await monzo_client.test_auth()
+            while not auth:
+                gap = True
+                try:
+                    await scheduler.send(
+                        priority=DM,
+                        channel=tenant.slack_user_id,
+                        text=f":x: Monzo authentication failed. Please re-authenticate <{tenants.auth_url(tenant)}|here>.",
+                    )
+                except Exception as e:
+                    # Slack being down mustn't stop the checks, the DM is sent again next round
+                    logging.warning(
+                        f"Failed to ask {tenant.id} to re-authenticate: {e}"
+                    )
+                await asyncio.sleep(100)
+                auth = await monzo_client.test_auth()
 
-        await env.monzo_client.check_webhooks()
-        # if not auth and res:
-        #     await env.slack_client.chat_postMessage(
-        #         channel=env.slack_user_id,
-        #         text=":white_check_mark: Authenticated successfully",
-        #     )
+            await monzo_client.check_webhooks()
+            await monzo_client.warm_pots()
+            if gap:
+                # webhooks may have been missed while we were down or unauthorised
+                await backfill(tenant)
+                gap = False
+            # if not auth and res:
+            #     await env.slack_client.chat_postMessage(
+            #         channel=tenant.slack_user_id,
+            #         text=":white_check_mark: Authenticated successfully",
+            #     )
+        except Exception:
+            logging.exception(f"Auth check failed for {tenant.id}")
+            await asyncio.sleep(100)
+            continue
         await asyncio.sleep(1200)
@@ -2,10 +2,25 @@ import asyncio
 import binascii
 import logging
 import os
+import time
+from datetime import datetime
 from typing import Any
+from typing import AsyncIterator
+from typing import Awaitable
+from typing import Callable
 from typing import Optional
+from typing import TYPE_CHECKING
 
 from aiohttp import ClientSession
+from aiohttp import ClientTimeout
+
+from abd.utils.monzo.cache import PotCache
+from abd.utils.ratelimit import backoff
+from abd.utils.ratelimit import EndpointStats
+from abd.utils.ratelimit import TokenBucket
+
+if TYPE_CHECKING:
+    from abd.utils.breaker import CircuitBreaker
 
 
 BASE = "https://api.monzo.com"
@@ -13,7 +28,20 @@ BASE = "https://api.monzo.com"
 
 class MonzoHandler:
     def __init__(
-        self, client_id: str, client_secret: str, domain: str, webhook_verification: str
+        self,
+        client_id: str,
+        client_secret: str,
+        domain: str,
+        webhook_verification: str,
+        pot_cache_ttl: float = 600,
+        pot_cache_size: int = 256,
+        rate: float = 5,
+        burst: float = 10,
+        timeout: float = 30,
+        max_retries: int = 3,
+        base_url: str = BASE,
+        refresh_margin: float = 300,
+        breaker: Optional["CircuitBreaker"] = None,
     ) -> None:
         self.state: Optional[str] = None
         self.client_id = client_id
@@ -21,133 +49,215 @@ class MonzoHandler:
         self.redirect_uri = f"{domain}/monzo/callback"
         self.domain = domain
         self.webhook_verification = webhook_verification
+        self.base_url = base_url
         self.session: ClientSession
 
         self.access_token: Optional[str] = None
         self.refresh_token: Optional[str] = None
         self.expires_in: Optional[int] = None
+        self.expires_at: Optional[float] = None
         self.user_id: Optional[str] = None
+        self.listeners: list[Callable[[], None]] = []
+        # wraps refreshes so several processes don't spend the same refresh token
+        self.refresh_guard: Optional[
+            Callable[[Callable[[], Awaitable[bool]]], Awaitable[bool]]
+        ] = None
+        self.refresh_margin = refresh_margin
+        # shared by every tenant, since an outage affects them all
+        self.breaker = breaker
+        self.refreshing: Optional[asyncio.Task] = None
+        # account id -> (created, id) of the newest transaction handled
+        self.cursors: dict[str, tuple[str, str]] = {}
+
+        self.limiter = TokenBucket(rate, burst)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.stats: dict[str, EndpointStats] = {}
+        self.retry_sleep = 0.0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+        self.pots = PotCache(
+            self.get_pots, ttl=pot_cache_ttl, max_accounts=pot_cache_size
+        )
 
     def generate_state(self) -> str:
         signature = binascii.hexlify(os.urandom(32))
         state = signature.decode("utf-8")
         self.state = state
+        self.changed()
         return state
 
+    def changed(self):
+        for listener in self.listeners:
+            listener()
+
+    def set_tokens(self, res: dict):
+        self.access_token = res.get("access_token")
+        self.refresh_token = res.get("refresh_token")
+        self.expires_in = res.get("expires_in")
+        self.expires_at = time.time() + self.expires_in if self.expires_in else None
+        self.user_id = res.get("user_id")
+        self.changed()
+
+    def refresh_at(self) -> Optional[float]:
+        if self.expires_at is None or self.refresh_token is None:
+            return None
+        margin = self.refresh_margin
+        if self.expires_in:
+            # short-lived tokens would otherwise always look like they're expiring
+            margin = min(margin, self.expires_in / 2)
+        return self.expires_at - margin
+
+    def expiring(self) -> bool:
+        refresh_at = self.refresh_at()
+        return refresh_at is not None and time.time() > refresh_at
+
+    def dump_tokens(self) -> dict:
+        return {
+            "access_token": self.access_token,
+            "refresh_token": self.refresh_token,
+            "expires_in": self.expires_in,
+            "expires_at": self.expires_at,
+            "user_id": self.user_id,
+            "state": self.state,
+        }
+
+    def restore_tokens(self, data: dict):
+        self.access_token = data.get("access_token")
+        self.refresh_token = data.get("refresh_token") or self.refresh_token
+        self.expires_in = data.get("expires_in")
+        self.expires_at = data.get("expires_at")
+        self.user_id = data.get("user_id")
+        self.state = data.get("state")
+
+    def dump(self) -> dict:
+        return {
+            **self.dump_tokens(),
+            "pots": self.pots.dump(),
+            "cursors": self.cursors,
+        }
+
+    def restore(self, data: dict):
+        self.restore_tokens(data)
+        self.pots.restore(data.get("pots", {}))
+        for account_id, cursor in data.get("cursors", {}).items():
+            self.advance_cursor(account_id, *cursor)
+
+    def advance_cursor(self, account_id: str, created: str | None, id: str):
+        if not created:
+            return
+        cursor = self.cursors.get(account_id)
+        if cursor and datetime.fromisoformat(created) < datetime.fromisoformat(
+            cursor[0]
+        ):
+            return
+        self.cursors[account_id] = (created, id)
+
     def generate_monzo_url(self) -> str:
         self.generate_state()
         return f"https://auth.monzo.com/?client_id={self.client_id}&redirect_uri={self.redirect_uri}&response_type=code&state={self.state}"
 
-    async def post(self, path: str, no_auth: bool = False, **kwargs) -> tuple[Any, int]:
+    async def request(
+        self,
+        method: str,
+        path: str,
+        no_auth: bool = False,
+        timeout: float | None = None,
+        **kwargs,
+    ) -> tuple[Any, int]:
+        deadline = time.monotonic() + (timeout or self.timeout)
         headers = kwargs.pop("headers", {})
+        stats = self.stats.setdefault(
+            f"{method} {path.split('?', 1)[0]}", EndpointStats()
+        )
+        retryable = method != "POST"
+        refreshed = False
+        attempt = 0
 
-        if not no_auth:
-            headers["Authorization"] = f"Bearer {self.access_token}"
+        if not no_auth and self.expiring():
+            await self.refresh_access_token()
 
-        try:
-            async with self.session.post(
-                f"{BASE}/{path}", headers=headers, **kwargs
-            ) as res:
-                if res.status == 401:
-                    await self.refresh_access_token()
-                    return await self.post(path, no_auth, **kwargs)
-                elif res.status == 429:
-                    logging.warning("Rate limited")
-                    retry = float(res.headers.get("Retry-After", 5))
-                    await asyncio.sleep(retry)
-                    return await self.post(path, no_auth, **kwargs)
-                elif res.status == 403:
-                    logging.error(
-                        "Request authenticated but has no perms - not confirmed in app?"
-                    )
-                    return None, 403
-                json = await res.json()
-                return json, res.status
-        except Exception as e:
-            logging.error(f"An error occurred during POST request: {e}")
-            return None, 500
+        while True:
+            if self.breaker and not self.breaker.allow():
+                return None, 503
+            if not await self.limiter.acquire(deadline - time.monotonic()):
+                logging.warning(f"Gave up waiting for a {method} {path} slot")
+                return None, 429
 
-    async def get(self, path: str, no_auth: bool = False, **kwargs) -> tuple[Any, int]:
-        headers = kwargs.pop("headers", {})
-        if not no_auth:
-            headers["Authorization"] = f"Bearer {self.access_token}"
+            token = self.access_token
+            if not no_auth:
+                headers["Authorization"] = f"Bearer {token}"
 
-        try:
-            async with self.session.get(
-                f"{BASE}/{path}", headers=headers, **kwargs
-            ) as res:
-                if res.status == 401:
-                    await self.refresh_access_token()
-                    return await self.get(path, no_auth, **kwargs)
-                elif res.status == 429:
-                    retry = float(res.headers.get("Retry-After", 5))
-                    logging.warning(f"Rate limited for {retry}s")
-                    await asyncio.sleep(retry)
-                    return await self.get(path, no_auth, **kwargs)
-                elif res.status == 403:
-                    logging.error(
-                        "Request authenticated but has no perms - not confirmed in app?"
-                    )
-                    return None, 403
-                json = await res.json()
-                return json, res.status
-        except Exception as e:
-            logging.error(f"An error occurred during GET request: {e}")
-            return None, 500
+            started = time.monotonic()
+            try:
+                async with self.session.request(
+                    method,
+                    f"{self.base_url}/{path}",
+                    headers=headers,
+                    timeout=ClientTimeout(
+                        total=max(deadline - started, 0.001),
+                        connect=self.session.timeout.connect,
+                    ),
+                    **kwargs,
+                ) as res:
+                    status = res.status
+                    stats.record(status, time.monotonic() - started)
+                    if self.breaker:
+                        if status >= 500:
+                            self.breaker.failure()
+                        else:
+                            self.breaker.success()
+                    if status == 401 and not no_auth and not refreshed:
+                        refreshed = True
+                        # another request may already have refreshed while this one was in flight
+                        if (
+                            token != self.access_token
+                            or await self.refresh_access_token()
+                        ):
+                            continue
+                        return None, 401
+                    elif status == 429:
+                        delay = float(res.headers.get("Retry-After", backoff(attempt)))
+                        self.limiter.pause(delay)
+                        logging.warning(f"Rate limited for {delay}s")
+                    elif status >= 500 and retryable:
+                        delay = backoff(attempt)
+                    elif status == 403:
+                        logging.error(
+                            "Request authenticated but has no perms - not confirmed in app?"
+                        )
+                        return None, 403
+                    else:
+                        return await res.json(), status
+            except Exception as e:
+                stats.errors += 1
+                if self.breaker:
+                    self.breaker.failure()
+                logging.error(f"An error occurred during {method} request: {e}")
+                if not retryable:
+                    return None, 500
+                status = 500
+                delay = backoff(attempt)
 
-    async def put(self, path: str, **kwargs) -> tuple[Any, int]:
-        headers = kwargs.pop("headers", {})
-        headers["Authorization"] = f"Bearer {self.access_token}"
+            attempt += 1
+            if attempt > self.max_retries or time.monotonic() + delay > deadline:
+                return None, status
+            stats.retries += 1
+            self.retry_sleep += delay
+            await asyncio.sleep(delay)
 
-        try:
-            async with self.session.put(
-                f"{BASE}/{path}", headers=headers, **kwargs
-            ) as res:
-                if res.status == 401:
-                    await self.refresh_access_token()
-                    return await self.put(path, **kwargs)
-                elif res.status == 429:
-                    retry = float(res.headers.get("Retry-After", 5))
-                    logging.warning(f"Rate limited for {retry}s")
-                    await asyncio.sleep(retry)
-                    return await self.put(path, **kwargs)
-                elif res.status == 403:
-                    logging.error(
-                        "Request authenticated but has no perms - not confirmed in app?"
-                    )
-                    return None, 403
-                json = await res.json()
-                return json, res.status
-        except Exception as e:
-            logging.error(f"An error occurred during PUT request: {e}")
-            return None, 500
+    async def post(self, path: str, no_auth: bool = False, **kwargs) -> tuple[Any, int]:
+        return await self.request("POST", path, no_auth, **kwargs)
 
-    async def delete(self, path: str, **kwargs) -> tuple[Any, int]:
-        headers = kwargs.pop("headers", {})
-        headers["Authorization"] = f"Bearer {self.access_token}"
+    async def get(self, path: str, no_auth: bool = False, **kwargs) -> tuple[Any, int]:
+        return await self.request("GET", path, no_auth, **kwargs)
 
-        try:
-            async with self.session.delete(
-                f"{BASE}/{path}", headers=headers, **kwargs
-            ) as res:
-                if res.status == 401:
-                    await self.refresh_access_token()
-                    return await self.delete(path, **kwargs)
-                elif res.status == 429:
-                    retry = float(res.headers.get("Retry-After", 5))
-                    logging.warning(f"Rate limited for {retry}s")
-                    await asyncio.sleep(retry)
-                    return await self.delete(path, **kwargs)
-                elif res.status == 403:
-                    logging.error(
-                        "Request authenticated but has no perms - not confirmed in app?"
-                    )
-                    return None, 403
-                json = await res.json()
-                return json, res.status
-        except Exception as e:
-            logging.error(f"An error occurred during DELETE request: {e}")
-            return None, 500
+    async def put(self, path: str, **kwargs) -> tuple[Any, int]:
+        return await self.request("PUT", path, **kwargs)
+
+    async def delete(self, path: str, **kwargs) -> tuple[Any, int]:
+        return await self.request("DELETE", path, **kwargs)
 
     async def exchange_code(self, code: str) -> bool:
         res, status = await self.post(
@@ -161,19 +271,26 @@ class MonzoHandler:
             },
             no_auth=True,
         )
-        if status == 429:
-            retry = float(res.headers.get("Retry-After", 5))
-            await asyncio.sleep(retry)
-            return await self.exchange_code(code)
-        elif status != 200:
+        if status != 200:
             return False
-        self.access_token = res.get("access_token")
-        self.refresh_token = res.get("refresh_token")
-        self.expires_in = res.get("expires_in")
-        self.user_id = res.get("user_id")
+        self.set_tokens(res)
         return True
 
     async def refresh_access_token(self) -> bool:
+        # concurrent callers share one refresh, a refresh token can only be spent once
+        if not self.refreshing:
+            self.refreshing = asyncio.create_task(self.run_refresh())
+        return await asyncio.shield(self.refreshing)
+
+    async def run_refresh(self) -> bool:
+        try:
+            if self.refresh_guard:
+                return await self.refresh_guard(self.exchange_refresh_token)
+            return await self.exchange_refresh_token()
+        finally:
+            self.refreshing = None
+
+    async def exchange_refresh_token(self) -> bool:
         res, status = await self.post(
             "oauth2/token",
             data={
@@ -185,11 +302,10 @@ class MonzoHandler:
             no_auth=True,
         )
         if status != 200:
+            self.refresh_failures += 1
             return False
-        self.access_token = res.get("access_token")
-        self.refresh_token = res.get("refresh_token")
-        self.expires_in = res.get("expires_in")
-        self.user_id = res.get("user_id")
+        self.set_tokens(res)
+        self.refreshes += 1
         logging.info("Refreshed access token")
         return True
 
@@ -234,9 +350,45 @@ class MonzoHandler:
             return []
         return res.get("pots", [])
 
+    async def get_transactions(
+        self, account_id: str, since: str, page_size: int = 100
+    ) -> AsyncIterator[dict]:
+        while True:
+            res, status = await self.get(
+                "transactions",
+                params={
+                    "account_id": account_id,
+                    "since": since,
+                    "limit": page_size,
+                    "expand[]": "merchant",
+                },
+            )
+            if status != 200:
+                logging.error(f"Failed to get transactions: {status}")
+                return
+            page = res.get("transactions", [])
+            for transaction in page:
+                yield transaction
+            if len(page) < page_size:
+                return
+            since = page[-1]["id"]
+
     async def get_pot(self, id: str, account_id: str) -> Optional[dict]:
-        pots = await self.get_pots(account_id)
-        for pot in pots:
-            if pot.get("id") == id:
-                return pot
-        return None
+        return await self.pots.get(id, account_id)
+
+    async def get_accounts(self) -> list[dict]:
+        res, _status = await self.get("accounts")
+        if _status != 200:
+            logging.error(f"Failed to get accounts: {_status}")
+            return []
+        return res.get("accounts", [])
+
+    async def warm_pots(self):
+        accounts = await self.get_accounts()
+        await asyncio.gather(
+            *(
+                self.pots.refresh(account["id"])
+                for account in accounts
+                if not account.get("closed")
+            )
+        )
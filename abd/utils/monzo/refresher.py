@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import time
+
+from abd.utils.tenants import Tenant
+from abd.utils.tenants import tenants
+
+
+class TokenRefresher:
+    def __init__(
+        self, retry_after: float = 60, max_sleep: float = 60, concurrency: int = 10
+    ) -> None:
+        self.retry_after = retry_after
+        self.max_sleep = max_sleep
+        self.concurrency = concurrency
+        self.retry_at: dict[str, float] = {}
+        self.task: asyncio.Task | None = None
+
+    def due(self, tenant: Tenant) -> float | None:
+        due = tenant.monzo_client.refresh_at()
+        if due is None:
+            return None
+        return max(due, self.retry_at.get(tenant.id, 0))
+
+    async def refresh(self, tenant: Tenant):
+        if not await tenant.monzo_client.refresh_access_token():
+            self.retry_at[tenant.id] = time.time() + self.retry_after
+            logging.warning(f"Proactive token refresh failed for {tenant.id}")
+        else:
+            self.retry_at.pop(tenant.id, None)
+
+    async def run(self) -> float:
+        now = time.time()
+        due = [tenant for tenant in tenants if (self.due(tenant) or now + 1) <= now]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def refresh(tenant: Tenant):
+            async with semaphore:
+                await self.refresh(tenant)
+
+        await asyncio.gather(*(refresh(tenant) for tenant in due))
+
+        # new tokens from OAuth callbacks are picked up within max_sleep
+        upcoming = [d for d in map(self.due, tenants) if d is not None]
+        return min([self.max_sleep, *(d - time.time() for d in upcoming)])
+
+    async def loop(self):
+        while True:
+            try:
+                delay = await self.run()
+            except Exception:
+                logging.exception("Token refresh loop failed")
+                delay = self.retry_after
+            await asyncio.sleep(max(delay, 0))
+
+    def start(self):
+        self.task = asyncio.create_task(self.loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+
+refresher = TokenRefresher()
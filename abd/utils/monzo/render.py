@@ -0,0 +1,166 @@
+from functools import lru_cache
+from typing import Callable
+from typing import NamedTuple
+
+from abd.utils.monzo.types import CURRENCIES
+from abd.utils.monzo.types import TransactionData
+from abd.utils.monzo.types import TransactionSchemes
+
+DEFAULT = "{emoji} <@{user}> {action} *{amount}*{region}{category}"
+TO_SOMEONE = "{emoji} <@{user}> {action} *{amount}* {direction} {merchant}"
+IN_THE_UK = TO_SOMEONE + " in the :flag-gb: UK"
+
+
+class Transaction(NamedTuple):
+    id: str
+    account_id: str
+    created: str | None
+    scheme: str
+    category: str
+    local_amount: int
+    local_currency: str
+    amount: int
+    currency: str
+    merchant_id: str | None
+    merchant_name: str | None
+    pot_id: str | None
+    name: str
+    emoji: str
+    icon: str | None
+    amount_str: str
+    sentence: str
+
+
+class Renderer(NamedTuple):
+    template: str
+    emoji: str
+    name: str
+    actions: tuple[str, str] = ("spent", "received")
+    directions: tuple[str, str] = ("to", "from")
+    outgoing: Callable[[int, int], bool] = lambda local, _amount: local < 0
+    merchant_name: bool = False
+    pot: bool = False
+
+
+RENDERERS: dict[str, Renderer] = {
+    TransactionSchemes.Mastercard.value: Renderer(
+        DEFAULT, ":money-printer:", "Mystery Place", merchant_name=True
+    ),
+    TransactionSchemes.P2PPayment.value: Renderer(
+        TO_SOMEONE + " through :monzo-pride: Monzo",
+        ":ac--item-bellcoin:",
+        "Monzo Transfer",
+    ),
+    TransactionSchemes.FasterPayments.value: Renderer(
+        IN_THE_UK, ":money-tub:", "Faster Payments"
+    ),
+    TransactionSchemes.Bacs.value: Renderer(IN_THE_UK, ":money_with_wings:", "Bacs"),
+    TransactionSchemes.PostOfficeDeposit.value: Renderer(
+        "{emoji} <@{user}> {action} *{amount}* {direction} their account",
+        ":pound:",
+        "Post Office Deposit",
+        actions=("withdrew", "deposited"),
+        directions=("from", "into"),
+        outgoing=lambda _local, amount: amount <= 0,
+    ),
+    TransactionSchemes.PotTransfer.value: Renderer(
+        "{emoji} <@{user}> {action} *{amount}* {direction} a pot",
+        ":potted_plant:",
+        "Unknown Pot",
+        actions=("transferred", "withdrew"),
+        outgoing=lambda _local, amount: amount < 0,
+        pot=True,
+    ),
+}
+
+
+@lru_cache(maxsize=256)
+def unknown_renderer(scheme: str) -> Renderer:
+    return Renderer(
+        TO_SOMEONE,
+        ":ac--item-bellcoin:",
+        f"{scheme.title().replace('_', ' ')} Transaction",
+    )
+
+
+FORMATTERS: dict[str, Callable[[float], str]] = {
+    currency: template.replace("{}", "{:.2f}").format
+    for currency, template in CURRENCIES.items()
+}
+
+
+def format_currency(minor: int, currency: str) -> str:
+    formatter = FORMATTERS.get(currency)
+    if not formatter:
+        formatter = FORMATTERS[currency] = f"{currency} {{:.2f}}".format
+    return formatter(abs(minor) / 100)
+
+
+def format_amount(local_amount: int, local_currency: str, amount: int, currency: str):
+    amount_str = format_currency(local_amount, local_currency)
+    if local_currency != currency:
+        amount_str += f" ({format_currency(amount, currency)})"
+    return amount_str
+
+
+def render(data: TransactionData, user: str, pot: dict | None = None) -> Transaction:
+    renderer = RENDERERS.get(data.scheme) or unknown_renderer(data.scheme)
+    local_amount = data.local_amount or 0
+    amount = data.amount or 0
+    category = (data.category or "Unknown").title()
+
+    merchant = data.merchant
+    emoji = None
+    icon = None
+    merchant_name = None
+    region = ""
+    if merchant:
+        icon = merchant.logo
+        merchant_name = merchant.name
+        emoji = merchant.emoji or data.emoji
+        address = merchant.address
+        if address and address.city and address.country:
+            region = f" in {address.city}, {address.country.title()}"
+    emoji = emoji or renderer.emoji
+
+    name = renderer.name
+    if renderer.merchant_name and merchant_name:
+        name = merchant_name
+    elif renderer.pot:
+        pot = pot or {}
+        name = pot.get("name", name)
+        cover = pot.get("cover_image_url")
+        icon = f"https://square.uwu.mba/square?url={cover}" if cover else None
+
+    outgoing = 0 if renderer.outgoing(local_amount, amount) else 1
+    amount_str = format_amount(local_amount, data.local_currency, amount, data.currency)
+    sentence = renderer.template.format(
+        emoji=emoji,
+        user=user,
+        action=renderer.actions[outgoing],
+        amount=amount_str,
+        direction=renderer.directions[outgoing],
+        merchant=merchant_name or "somewhere",
+        region=region,
+        category=f" on {category}",
+    )
+
+    return Transaction(
+        id=data.id,
+        account_id=data.account_id,
+        created=data.created,
+        scheme=data.scheme,
+        category=category,
+        local_amount=local_amount,
+        local_currency=data.local_currency,
+        amount=amount,
+        currency=data.currency,
+        merchant_id=merchant.id if merchant else None,
+        merchant_name=merchant_name,
+        pot_id=data.metadata.pot_id if data.metadata else None,
+        name=name,
+        emoji=emoji,
+        icon=icon,
+        amount_str=amount_str,
+        sentence=sentence,
+    )
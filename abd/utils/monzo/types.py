@@ -2,8 +2,7 @@ from enum import Enum
 
 from pydantic import BaseModel
 from pydantic import ConfigDict
-
-from abd.utils.env import env
+from pydantic import ValidationError
 
 
 class TransactionSchemes(Enum):
@@ -29,18 +28,17 @@ CURRENCIES = {
 }
 
 
-class MonzoMerchantAddressData(BaseModel):
-    model_config = ConfigDict(extra="allow")
-    address: str | None
-    city: str | None
-    country: str | None
-    region: str | None
+# Compact models only keep what rendering and storage use. They are strict so that
+# validating straight from the request bytes stays on pydantic's fast path.
+class MerchantAddressData(BaseModel):
+    model_config = ConfigDict(extra="ignore", strict=True)
+    city: str | None = None
+    country: str | None = None
 
 
-class MonzoMerchantData(BaseModel):
-    model_config = ConfigDict(extra="allow")
-    address: MonzoMerchantAddressData | None
-    group_id: str | None = None
+class MerchantData(BaseModel):
+    model_config = ConfigDict(extra="ignore", strict=True)
+    address: MerchantAddressData | None = None
     id: str
     logo: str | None = None
     emoji: str | None = None
@@ -48,19 +46,16 @@ class MonzoMerchantData(BaseModel):
     category: str | None = "Unknown"
 
 
-class MonzoTransactionMetadata(BaseModel):
-    model_config = ConfigDict(extra="allow")
-    external_id: str | None = None
-    pot_account_id: str | None = None
+class TransactionMetadata(BaseModel):
+    model_config = ConfigDict(extra="ignore", strict=True)
     pot_id: str | None = None
-    user_id: str | None = None
-    trigger: str | None = None
 
 
-class MonzoTransactionData(BaseModel):
-    model_config = ConfigDict(extra="allow")
+class TransactionData(BaseModel):
+    model_config = ConfigDict(extra="ignore", strict=True)
     account_id: str
-    category: str | None
+    category: str | None = None
+    created: str | None = None
     id: str
     local_amount: int
     local_currency: str
@@ -68,153 +63,56 @@ class MonzoTransactionData(BaseModel):
     amount: int
     scheme: str
     emoji: str | None = None
-    settled: str | None
-    merchant: MonzoMerchantData | None
+    settled: str | None = None
+    merchant: MerchantData | None = None
     decline_reason: str | None = None
-    metadata: MonzoTransactionMetadata | None
+    metadata: TransactionMetadata | None = None
     notes: str | None = None
 
 
-class MonzoResponse(BaseModel):
-    model_config = ConfigDict(extra="allow")
+class WebhookEvent(BaseModel):
+    model_config = ConfigDict(extra="ignore", strict=True)
     type: str
-    data: MonzoTransactionData
+    data: TransactionData
+
+
+class MonzoMerchantAddressData(MerchantAddressData):
+    model_config = ConfigDict(extra="allow", strict=False)
+    address: str | None
+    city: str | None
+    country: str | None
+    region: str | None
 
 
-class BaseTransaction:
-    def __init__(self, data: MonzoTransactionData):
-        self.id = data.id
-        self.raw_local_amount = data.local_amount or 0
-        self.local_amount = abs(self.raw_local_amount)
-        self.local_currency = data.local_currency
-        self.raw_amount = data.amount or 0
-        self.amount = abs(self.raw_amount)
-        self.currency = data.currency
-
-        self.scheme = data.scheme.title().replace("_", " ")
-        self.category = data.category or "Unknown"
-        self.category = self.category.title()
+class MonzoMerchantData(MerchantData):
+    model_config = ConfigDict(extra="allow", strict=False)
+    address: MonzoMerchantAddressData | None
+    group_id: str | None = None
+
 
-        self.emoji = None
-        self.merchant = data.merchant
-        self.region_str = ""
-        self.icon = None
-        self.merchant_name = None
-        self.merchant_address = None
-        self.merchant_city = None
-        self.merchant_country = None
-
-        if self.merchant:
-            self.icon = self.merchant.logo
-            self.merchant_name = self.merchant.name
-            self.merchant_address = self.merchant.address
-            self.emoji = self.merchant.emoji or data.emoji or self.emoji
-            if self.merchant_address:
-                self.merchant_city = self.merchant_address.city or ""
-                self.merchant_country = self.merchant_address.country or ""
-                self.merchant_country = self.merchant_country.title()
-                self.region_str = (
-                    f" in {self.merchant_city}, {self.merchant_country}"
-                    if self.merchant_city and self.merchant_country
-                    else ""
-                )
-
-        self.amount_str = CURRENCIES.get(
-            self.local_currency, f"{self.local_currency} {{}}"
-        ).format("{:.2f}".format(self.local_amount / 100))
-
-        if self.local_currency != self.currency:
-            temp_amount_str = CURRENCIES.get(
-                self.currency, f"{self.currency} {{}}"
-            ).format("{:.2f}".format(self.amount / 100))
-            self.amount_str += f" ({temp_amount_str})"
-
-        self.spent = self.raw_local_amount < 0
-        self.action = "spent" if self.spent else "received"
-
-        self.display_name = self.merchant_name or "somewhere"
-        self.direction = "to" if self.spent else "from"
-        self.cat_str = f" on {self.category}" if self.category else ""
-        self.sentence = f"{self.emoji} <@{env.slack_user_id}> {self.action} *{self.amount_str}*{self.region_str}{self.cat_str}"
-
-
-class Mastercard(BaseTransaction):
-    def __init__(self, data: MonzoTransactionData):
-        super().__init__(data)
-        self.name = self.merchant_name or "Mystery Place"
-        self.emoji = self.emoji or ":money-printer:"
-
-        self.sentence = f"{self.emoji} <@{env.slack_user_id}> {self.action} *{self.amount_str}*{self.region_str}{self.cat_str}"
-
-
-class P2PPayment(BaseTransaction):
-    def __init__(self, data: MonzoTransactionData):
-        super().__init__(data)
-        self.name = "Monzo Transfer"
-        self.emoji = self.emoji or ":ac--item-bellcoin:"
-
-        self.sentence = f"{self.emoji} <@{env.slack_user_id}> {self.action} *{self.amount_str}* {self.direction} {self.display_name} through :monzo-pride: Monzo"
-
-
-class FasterPayments(BaseTransaction):
-    def __init__(self, data: MonzoTransactionData):
-        super().__init__(data)
-        self.name = "Faster Payments"
-        self.emoji = self.emoji or ":money-tub:"
-
-        self.sentence = f"{self.emoji} <@{env.slack_user_id}> {self.action} *{self.amount_str}* {self.direction} {self.display_name} in the :flag-gb: UK"
-
-
-class Bacs(BaseTransaction):
-    def __init__(self, data: MonzoTransactionData):
-        super().__init__(data)
-        self.name = "Bacs"
-        self.emoji = self.emoji or ":money_with_wings:"
-
-        self.sentence = f"{self.emoji} <@{env.slack_user_id}> {self.action} *{self.amount_str}* {self.direction} {self.display_name} in the :flag-gb: UK"
-
-
-class PostOfficeDeposit(BaseTransaction):
-    def __init__(self, data: MonzoTransactionData):
-        super().__init__(data)
-        self.name = "Post Office Deposit"
-        self.emoji = self.emoji or ":pound:"
-
-        self.action = "deposited" if self.raw_amount > 0 else "withdrew"
-        self.direction = "into" if self.raw_amount > 0 else "from"
-        self.sentence = f"{self.emoji} <@{env.slack_user_id}> {self.action} *{self.amount_str}* {self.direction} their account"
-
-
-class UnknownTransaction(BaseTransaction):
-    def __init__(self, data: MonzoTransactionData):
-        super().__init__(data)
-        self.name = f"{self.scheme} Transaction"
-        self.emoji = self.emoji or ":ac--item-bellcoin:"
-
-        self.sentence = f"{self.emoji} <@{env.slack_user_id}> {self.action} *{self.amount_str}* {self.direction} {self.display_name}"
-
-
-class PotTransfer(BaseTransaction):
-    def __init__(self, data: MonzoTransactionData, pot_info):
-        super().__init__(data)
-        self.name = pot_info.get("name", "Unknown Pot")
-        self.emoji = self.emoji or ":potted_plant:"
-        pot_icon = pot_info.get("cover_image_url", None)
-        self.icon = (
-            f"https://square.uwu.mba/square?url={pot_icon}" if pot_icon else None
-        )
+class MonzoTransactionMetadata(TransactionMetadata):
+    model_config = ConfigDict(extra="allow", strict=False)
+    external_id: str | None = None
+    pot_account_id: str | None = None
+    user_id: str | None = None
+    trigger: str | None = None
+
+
+class MonzoTransactionData(TransactionData):
+    model_config = ConfigDict(extra="allow", strict=False)
+    category: str | None
+    settled: str | None
+    merchant: MonzoMerchantData | None
+    metadata: MonzoTransactionMetadata | None
+
+
+class MonzoResponse(WebhookEvent):
+    model_config = ConfigDict(extra="allow", strict=False)
+    data: MonzoTransactionData
 
-        self.action = "transferred" if self.raw_amount < 0 else "withdrew"
-        self.sentence = f"{self.emoji} <@{env.slack_user_id}> {self.action} *{self.amount_str}* {self.direction} a pot"
-
-    @classmethod
-    async def create(cls, data: MonzoTransactionData):
-        metadata = data.metadata
-        pot_info = {}
-        if metadata:
-            pot_id = metadata.pot_id
-            account_id = data.account_id
-            if pot_id and account_id:
-                pot_info = await env.monzo_client.get_pot(pot_id, account_id) or {}
 
-        return cls(data, pot_info)
+def decode_webhook(body: bytes) -> WebhookEvent:
+    try:
+        return WebhookEvent.model_validate_json(body)
+    except ValidationError:
+        return MonzoResponse.model_validate_json(body)
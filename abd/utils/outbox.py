@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import Awaitable
+from typing import Callable
+
+from abd.utils.breaker import slack_breaker
+from abd.utils.coordinator import coordinator
+from abd.utils.env import env
+from abd.utils.metrics import metrics
+from abd.utils.monzo.types import decode_webhook
+from abd.utils.monzo.types import WebhookEvent
+from abd.utils.ratelimit import TokenBucket
+from abd.utils.tenants import Tenant
+from abd.utils.tenants import tenants
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    tenant TEXT NOT NULL,
+    body BLOB NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    due REAL NOT NULL,
+    claimed_until REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (due);
+"""
+
+CLAIM = """
+UPDATE outbox SET claimed_until = ?
+WHERE id IN (
+    SELECT id FROM outbox WHERE due <= ? AND claimed_until < ? ORDER BY id LIMIT ?
+)
+RETURNING id, tenant, body
+"""
+
+# wait 10s, 20s, 40s... up to 10 minutes between attempts
+RETRY = """
+UPDATE outbox SET attempts = attempts + 1, claimed_until = 0,
+    due = ? + min(600, 10 * (1 << min(attempts, 6)))
+WHERE id IN ({})
+"""
+
+
+class Outbox:
+    def __init__(
+        self,
+        path: str | None,
+        rate: float,
+        lease: float,
+        max_attempts: int,
+        interval: float = 1,
+    ) -> None:
+        self.path = path
+        self.limiter = TokenBucket(rate, max(rate, 1))
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.interval = interval
+        self.db: sqlite3.Connection | None = None
+        # entries this process is still handling, their leases are renewed until they finish
+        self.inflight: set[int] = set()
+        self.tasks: list[asyncio.Task] = []
+        self.replayed = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def connect(self):
+        self.db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        if not self.db:
+            self.connect()
+        return self.db.execute(sql, params)
+
+    def add(self, tenant: str, body: bytes) -> int | None:
+        # written before the event is handled so a crash or an outage can't lose it
+        if not self.enabled:
+            return None
+        now = time.time()
+        id = self.execute(
+            "INSERT INTO outbox (tenant, body, due, claimed_until) VALUES (?, ?, ?, ?)",
+            (tenant, body, now, now + self.lease),
+        ).lastrowid
+        self.inflight.add(id)
+        return id
+
+    def complete(self, *ids: int | None):
+        ids = tuple(id for id in ids if id is not None)
+        self.inflight.difference_update(ids)
+        if ids:
+            placeholders = ", ".join("?" * len(ids))
+            self.execute(f"DELETE FROM outbox WHERE id IN ({placeholders})", ids)
+
+    def retry(self, *ids: int | None):
+        ids = tuple(id for id in ids if id is not None)
+        self.inflight.difference_update(ids)
+        if not ids:
+            return
+        placeholders = ", ".join("?" * len(ids))
+        self.execute(RETRY.format(placeholders), (time.time(), *ids))
+        dropped = self.execute(
+            f"DELETE FROM outbox WHERE attempts >= ? AND id IN ({placeholders})",
+            (self.max_attempts, *ids),
+        ).rowcount
+        if dropped:
+            self.dropped += dropped
+            logging.error(
+                f"Gave up on {dropped} events after {self.max_attempts} attempts"
+            )
+
+    def claim(self, limit: int) -> list[tuple[int, str, bytes]]:
+        now = time.time()
+        return self.execute(CLAIM, (now + self.lease, now, now, limit)).fetchall()
+
+    def renew(self):
+        # a row only becomes claimable again once the process handling it has died
+        ids = tuple(self.inflight)
+        if ids:
+            placeholders = ", ".join("?" * len(ids))
+            self.execute(
+                f"UPDATE outbox SET claimed_until = ? WHERE id IN ({placeholders})",
+                (time.time() + self.lease, *ids),
+            )
+
+    async def keep_leases(self):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                self.renew()
+            except Exception:
+                logging.exception("Failed to renew outbox leases")
+
+    def pending(self) -> int:
+        if not self.enabled:
+            return 0
+        return self.execute("SELECT count(*) FROM outbox").fetchone()[0]
+
+    async def replay(
+        self, handle: Callable[[Tenant, WebhookEvent, int | None], Awaitable]
+    ):
+        while True:
+            try:
+                # nothing gets through until Slack is back, so don't pull events off the disk
+                rows = self.claim(10) if slack_breaker.ready() else []
+                if not rows:
+                    await asyncio.sleep(self.interval)
+                    continue
+                for id, tenant_id, body in rows:
+                    if id in self.inflight:
+                        continue
+                    tenant = tenants.get(tenant_id)
+                    if not tenant:
+                        self.complete(id)
+                        continue
+                    await self.limiter.acquire()
+                    self.replayed += 1
+                    self.inflight.add(id)
+                    await handle(tenant, decode_webhook(body), id)
+            except Exception:
+                logging.exception("Failed to replay the outbox")
+                await asyncio.sleep(self.interval)
+
+    def start(self, handle: Callable[[Tenant, WebhookEvent, int | None], Awaitable]):
+        if not self.enabled:
+            return
+        if not coordinator.enabled:
+            # a lone process owns every claim, so whatever it held before a crash is free again
+            self.execute("UPDATE outbox SET claimed_until = 0")
+        pending = self.pending()
+        if pending:
+            logging.info(f"Replaying {pending} undelivered events from the outbox")
+        self.tasks = [
+            asyncio.create_task(self.replay(handle)),
+            asyncio.create_task(self.keep_leases()),
+        ]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+
+# each worker drains its share of the backlog
+outbox = Outbox(
+    env.outbox_path,
+    rate=env.outbox_drain_rate / env.workers,
+    lease=env.outbox_lease,
+    max_attempts=env.outbox_max_attempts,
+)
+
+metrics.gauge("abd_outbox_pending", "Events not yet delivered", outbox.pending)
+metrics.collector(
+    "abd_outbox_replayed_total",
+    "Events delivered from the outbox after a failure or restart",
+    "counter",
+    lambda: [("", {}, outbox.replayed)],
+)
+metrics.collector(
+    "abd_outbox_dropped_total",
+    "Events abandoned after too many failed deliveries",
+    "counter",
+    lambda: [("", {}, outbox.dropped)],
+)
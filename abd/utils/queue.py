@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+
+from abd.utils.env import env
+from abd.utils.metrics import metrics
+
+
+class EventQueue:
+    def __init__(self, workers: int, maxsize: int) -> None:
+        self.workers = workers
+        self.queue: asyncio.Queue[tuple[Callable[..., Awaitable[Any]], tuple]] = (
+            asyncio.Queue(maxsize=maxsize)
+        )
+        self.tasks: list[asyncio.Task] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def put(self, handler: Callable[..., Awaitable[Any]], *args) -> bool:
+        try:
+            self.queue.put_nowait((handler, args))
+        except asyncio.QueueFull:
+            logging.warning("Event queue full, rejecting event")
+            return False
+        return True
+
+    async def worker(self):
+        while True:
+            handler, args = await self.queue.get()
+            try:
+                await handler(*args)
+            except Exception:
+                logging.exception("Failed to process queued event")
+            finally:
+                self.queue.task_done()
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 30):
+        if self.tasks:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logging.warning(
+                    f"Dropping {self.queue.qsize()} queued events after {timeout}s"
+                )
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+
+queue = EventQueue(workers=env.webhook_workers, maxsize=env.webhook_queue_size)
+
+metrics.gauge(
+    "abd_webhook_queue_depth", "Webhooks waiting for a worker", queue.queue.qsize
+)
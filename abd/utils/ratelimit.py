@@ -0,0 +1,78 @@
+import asyncio
+import random
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waited = 0.0
+        self.lock = asyncio.Lock()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def try_acquire(self) -> bool:
+        self.refill(time.monotonic())
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def acquire(self, timeout: float | None = None) -> bool:
+        async with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            wait = max(
+                self.paused_until - now,
+                (1 - self.tokens) / self.rate if self.tokens < 1 else 0,
+            )
+            if timeout is not None and wait > timeout:
+                return False
+            if wait > 0:
+                self.waited += wait
+                await asyncio.sleep(wait)
+                self.refill(time.monotonic())
+            self.tokens -= 1
+            return True
+
+
+def backoff(attempt: int, base: float = 0.5, cap: float = 30) -> float:
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class EndpointStats:
+    __slots__ = ("requests", "retries", "errors", "statuses", "latency", "max_latency")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.statuses: dict[int, int] = {}
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, status: int, latency: float):
+        self.requests += 1
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.latency += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+            "statuses": self.statuses,
+            "avg_latency": self.latency / self.requests if self.requests else 0,
+            "max_latency": self.max_latency,
+        }
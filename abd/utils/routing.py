@@ -0,0 +1,142 @@
+import bisect
+import json
+import logging
+
+from abd.utils.env import env
+from abd.utils.metrics import metrics
+from abd.utils.monzo.render import Transaction
+
+FIELDS = ("scheme", "category", "currency", "merchant", "pot")
+KEYS = {"tenant", "channel", "min_amount", "max_amount", *FIELDS}
+
+
+def attributes(transaction: Transaction) -> tuple[tuple[str | None, ...], ...]:
+    # in the order of FIELDS, a merchant can be named by its id or its name
+    return (
+        (transaction.scheme,),
+        (transaction.category,),
+        (transaction.local_currency,),
+        (transaction.merchant_id, transaction.merchant_name),
+        (transaction.pot_id,),
+    )
+
+
+def check(rule: dict):
+    unknown = rule.keys() - KEYS
+    if unknown:
+        raise ValueError(f"Unknown routing rule keys: {', '.join(sorted(unknown))}")
+    if not rule.get("channel"):
+        raise ValueError(f"Routing rule without a channel: {rule}")
+    low, high = rule.get("min_amount", 0), rule.get("max_amount", 0)
+    if not isinstance(low, int) or not isinstance(high, int) or low < 0 or high < 0:
+        raise ValueError(f"Routing rule amounts must be whole minor units: {rule}")
+    if "max_amount" in rule and high < low:
+        raise ValueError(f"Routing rule can never match: {rule}")
+
+
+class RoutingTable:
+    def __init__(self, rules: list[dict]) -> None:
+        # rule n is bit n, so matching is a few ANDs however many rules there are
+        self.channels = [rule["channel"] for rule in rules]
+        self.by_channel: dict[str, int] = {}
+        for bit, channel in enumerate(self.channels):
+            self.by_channel[channel] = self.by_channel.get(channel, 0) | 1 << bit
+        self.indexes: list[tuple[dict[str, int], int]] = []
+        for field in FIELDS:
+            index: dict[str, int] = {}
+            wildcard = 0
+            for bit, rule in enumerate(rules):
+                accepted = rule.get(field)
+                if accepted is None:
+                    wildcard |= 1 << bit
+                    continue
+                for value in [accepted] if isinstance(accepted, str) else accepted:
+                    value = value.casefold()
+                    index[value] = index.get(value, 0) | 1 << bit
+            self.indexes.append((index, wildcard))
+
+        # amount ranges split the number line into segments, each knowing which rules cover it
+        starts: dict[int, int] = {0: 0}
+        ends: dict[int, int] = {}
+        for bit, rule in enumerate(rules):
+            low = rule.get("min_amount", 0)
+            starts[low] = starts.get(low, 0) | 1 << bit
+            if "max_amount" in rule:
+                end = rule["max_amount"] + 1
+                ends[end] = ends.get(end, 0) | 1 << bit
+        self.edges = sorted(starts.keys() | ends.keys())
+        self.segments = []
+        covering = 0
+        for edge in self.edges:
+            covering = (covering & ~ends.get(edge, 0)) | starts.get(edge, 0)
+            self.segments.append(covering)
+
+    def __len__(self) -> int:
+        return len(self.channels)
+
+    def match(self, transaction: Transaction) -> list[str]:
+        amount = abs(transaction.local_amount)
+        mask = self.segments[bisect.bisect_right(self.edges, amount) - 1]
+        for (index, wildcard), values in zip(self.indexes, attributes(transaction)):
+            if not mask:
+                return []
+            accepted = wildcard
+            for value in values:
+                if value is not None:
+                    accepted |= index.get(value.casefold(), 0)
+            mask &= accepted
+
+        channels = []
+        while mask:
+            channel = self.channels[(mask & -mask).bit_length() - 1]
+            channels.append(channel)
+            # the other rules for the same channel don't add anything
+            mask &= ~self.by_channel[channel]
+        return channels
+
+
+class Router:
+    def __init__(self) -> None:
+        self.default = RoutingTable([])
+        self.tables: dict[str, RoutingTable] = {}
+        self.rules = 0
+        self.routed = 0
+
+    def compile(self, rules: list[dict]):
+        for rule in rules:
+            check(rule)
+        # rules without a tenant apply to everyone
+        shared = [rule for rule in rules if "tenant" not in rule]
+        own: dict[str, list[dict]] = {}
+        for rule in rules:
+            if "tenant" in rule:
+                own.setdefault(rule["tenant"], []).append(rule)
+
+        self.default = RoutingTable(shared)
+        self.tables = {
+            tenant: RoutingTable(shared + tenant_rules)
+            for tenant, tenant_rules in own.items()
+        }
+        self.rules = len(rules)
+
+    def route(self, tenant_id: str, transaction: Transaction) -> list[str]:
+        return self.tables.get(tenant_id, self.default).match(transaction)
+
+    def load(self):
+        if not env.routes_file:
+            return
+        with open(env.routes_file) as f:
+            self.compile(json.load(f))
+        logging.info(f"Loaded {self.rules} routing rules from {env.routes_file}")
+
+
+router = Router()
+router.load()
+
+metrics.gauge("abd_routing_rules", "Loaded routing rules", lambda: router.rules)
+metrics.collector(
+    "abd_routed_messages_total",
+    "Copies of transaction messages posted to channels chosen by routing rules",
+    "counter",
+    lambda: [("", {}, router.routed)],
+)
@@ -0,0 +1,201 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any
+
+from abd.utils.breaker import CircuitOpen
+from abd.utils.breaker import slack_breaker
+from abd.utils.env import env
+from abd.utils.metrics import metrics
+from abd.utils.metrics import slack_post
+from abd.utils.ratelimit import TokenBucket
+
+LOG = 0
+DM = 1
+HEARTBEAT = 2
+
+
+class PriorityGate:
+    def __init__(self, slots: int) -> None:
+        self.slots = slots
+        self.waiters: list[tuple[int, int, asyncio.Future]] = []
+        self.counter = itertools.count()
+
+    async def acquire(self, priority: int):
+        if self.slots > 0 and not self.waiters:
+            self.slots -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self.waiters:
+            _priority, _seq, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.slots += 1
+
+    @contextlib.asynccontextmanager
+    async def hold(self, priority: int):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class Delivery:
+    __slots__ = ("method", "priority", "kwargs", "future")
+
+    def __init__(
+        self, method: str, priority: int, kwargs: dict, future: asyncio.Future
+    ) -> None:
+        self.method = method
+        self.priority = priority
+        self.kwargs = kwargs
+        self.future = future
+
+
+class Channel:
+    __slots__ = ("id", "pending", "limiter", "task")
+
+    def __init__(self, id: str, rate: float, burst: float) -> None:
+        self.id = id
+        self.pending: deque[Delivery] = deque()
+        self.limiter = TokenBucket(rate, burst)
+        self.task: asyncio.Task | None = None
+
+
+class SlackScheduler:
+    def __init__(self, rate: float, burst: float, concurrency: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.gate = PriorityGate(concurrency)
+        self.channels: dict[str, Channel] = {}
+        self.rate_limited = 0
+
+    def depth(self) -> int:
+        return sum(len(channel.pending) for channel in self.channels.values())
+
+    def submit(
+        self, method: str = "chat_postMessage", priority: int = LOG, **kwargs
+    ) -> asyncio.Future:
+        channel = self.channels.get(kwargs["channel"])
+        if not channel:
+            channel = Channel(kwargs["channel"], self.rate, self.burst)
+            self.channels[channel.id] = channel
+
+        future = asyncio.get_running_loop().create_future()
+        channel.pending.append(Delivery(method, priority, kwargs, future))
+        if not channel.task:
+            channel.task = asyncio.create_task(self.drain(channel))
+        return future
+
+    async def send(
+        self, method: str = "chat_postMessage", priority: int = LOG, **kwargs
+    ) -> Any:
+        return await self.submit(method, priority, **kwargs)
+
+    async def drain(self, channel: Channel):
+        # imported here so startup doesn't pay for slack_sdk before the first message
+        from slack_sdk.errors import SlackApiError
+
+        try:
+            while channel.pending:
+                delivery = channel.pending[0]
+                if delivery.future.done():
+                    channel.pending.popleft()
+                    continue
+
+                if not slack_breaker.allow():
+                    # fail fast while Slack is down, the outbox keeps the events for later
+                    channel.pending.popleft()
+                    self.fail(delivery, CircuitOpen(slack_breaker.name))
+                    continue
+
+                await channel.limiter.acquire()
+                async with self.gate.hold(delivery.priority):
+                    started = time.perf_counter()
+                    try:
+                        res = await getattr(env.slack_client, delivery.method)(
+                            **delivery.kwargs
+                        )
+                    except SlackApiError as e:
+                        if e.response.status_code >= 500:
+                            slack_breaker.failure()
+                        else:
+                            slack_breaker.success()
+                        if e.response.status_code == 429:
+                            retry = float(e.response.headers.get("Retry-After", 1))
+                            logging.warning(
+                                f"Slack rate limited {channel.id} for {retry}s"
+                            )
+                            self.rate_limited += 1
+                            channel.limiter.pause(retry)
+                            continue
+                        channel.pending.popleft()
+                        self.fail(delivery, e)
+                        continue
+                    except Exception as e:
+                        slack_breaker.failure()
+                        channel.pending.popleft()
+                        self.fail(delivery, e)
+                        continue
+                    finally:
+                        slack_post.observe(time.perf_counter() - started)
+
+                slack_breaker.success()
+                channel.pending.popleft()
+                if not delivery.future.done():
+                    delivery.future.set_result(res)
+        finally:
+            channel.task = None
+
+    def fail(self, delivery: Delivery, e: Exception):
+        if not delivery.future.done():
+            delivery.future.set_exception(e)
+
+    async def stop(self, timeout: float = 30):
+        tasks = [channel.task for channel in self.channels.values() if channel.task]
+        if not tasks:
+            return
+        _done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logging.warning(f"Dropping {self.depth()} undelivered Slack messages")
+
+
+# each worker gets its share of Slack's per-channel rate limit
+scheduler = SlackScheduler(
+    rate=env.slack_channel_rate / env.workers,
+    burst=env.slack_channel_burst,
+    concurrency=env.slack_concurrency,
+)
+
+metrics.gauge(
+    "abd_slack_queue_depth", "Slack messages waiting to be sent", scheduler.depth
+)
+metrics.collector(
+    "abd_slack_rate_limited_total",
+    "Slack API calls rejected with a 429",
+    "counter",
+    lambda: [("", {}, scheduler.rate_limited)],
+)
+metrics.collector(
+    "abd_slack_rate_limit_wait_seconds_total",
+    "Time Slack messages spent waiting for their channel's rate limiter",
+    "counter",
+    lambda: [("", {}, sum(c.limiter.waited for c in scheduler.channels.values()))],
+)
@@ -1,5 +1,100 @@
-from slack_bolt.async_app import AsyncApp
+from datetime import date
+from datetime import timedelta
+from functools import cache
+from typing import TYPE_CHECKING
 
+from abd.utils.aggregates import aggregates
 from abd.utils.env import env
+from abd.utils.monzo.render import format_currency
+from abd.utils.tenants import tenants
 
-app = AsyncApp(token=env.slack_bot_token, signing_secret=env.slack_signing_secret)
+if TYPE_CHECKING:
+    from slack_bolt.adapter.starlette.async_handler import AsyncSlackRequestHandler
+    from slack_bolt.async_app import AsyncAck
+
+USAGE = (
+    "Try `/monzo spent today|week|month [category]` or"
+    " `/monzo top merchants [today|week|month]`"
+)
+
+
+def period_start(period: str) -> date | None:
+    today = aggregates.today()
+    match period:
+        case "today":
+            return today
+        case "week":
+            return today - timedelta(days=today.weekday())
+        case "month":
+            return today.replace(day=1)
+    return None
+
+
+def format_totals(totals: dict[str, int]) -> str:
+    if not totals:
+        return format_currency(0, "GBP")
+    return " + ".join(
+        format_currency(amount, currency) for currency, amount in totals.items()
+    )
+
+
+def spent(tenant: str, args: list[str]) -> str:
+    period = args[0] if args else "today"
+    since = period_start(period)
+    if not since:
+        return USAGE
+    category = "_".join(args[1:]).lower() or None
+    totals = aggregates.spent(tenant, since, category)
+    where = f" on {category.replace('_', ' ')}" if category else ""
+    when = "today" if period == "today" else f"this {period}"
+    return f"You've spent *{format_totals(totals)}*{where} {when}"
+
+
+def top_merchants(tenant: str, args: list[str]) -> str:
+    period = args[0] if args else "month"
+    since = period_start(period)
+    if not since:
+        return USAGE
+    top = aggregates.top_merchants(tenant, since)
+    if not top:
+        return "No spending with merchants yet"
+    when = "today" if period == "today" else f"this {period}"
+    lines = [f"*Top merchants {when}*"]
+    for i, (name, currency, amount, count) in enumerate(top, 1):
+        lines.append(f"{i}. {name}: *{format_currency(amount, currency)}* ({count}x)")
+    return "\n".join(lines)
+
+
+async def monzo_command(ack: "AsyncAck", command: dict):
+    tenant = tenants.by_user.get(command["user_id"])
+    if not tenant:
+        await ack(text="You haven't connected a Monzo account")
+        return
+
+    # answered straight from memory, well within Slack's 3 second ack window
+    args = command.get("text", "").lower().split()
+    match args:
+        case ["spent", *rest]:
+            text = spent(tenant.id, rest)
+        case ["top", "merchants", *rest]:
+            text = top_merchants(tenant.id, rest)
+        case _:
+            text = USAGE
+    await ack(text=text)
+
+
+@cache
+def request_handler() -> "AsyncSlackRequestHandler":
+    # slack_bolt takes a while to import, so the app is built on first use
+    from slack_bolt.adapter.starlette.async_handler import AsyncSlackRequestHandler
+    from slack_bolt.async_app import AsyncApp
+
+    app = AsyncApp(signing_secret=env.slack_signing_secret, client=env.slack_client)
+    app.command("/monzo")(monzo_command)
+    return AsyncSlackRequestHandler(app)
+
+
+def load_slack():
+    # slack_sdk and slack_bolt are only ever imported here, in one thread, so the imports can't race
+    env.slack_client
+    request_handler()
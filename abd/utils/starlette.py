@@ -1,43 +1,51 @@
-from slack_bolt.adapter.starlette.async_handler import AsyncSlackRequestHandler
+import logging
+import time
+
+from pydantic import ValidationError
 from starlette.applications import Starlette
 from starlette.requests import Request
 from starlette.responses import JSONResponse
+from starlette.responses import PlainTextResponse
 from starlette.routing import Route
 
 from abd.__main__ import main
+from abd.utils.admission import admission
+from abd.utils.breaker import BREAKERS
+from abd.utils.dedup import event_key
+from abd.utils.dedup import seen
 from abd.utils.env import env
-from abd.utils.logging import send_heartbeat
-from abd.utils.monzo.types import Bacs
-from abd.utils.monzo.types import FasterPayments
-from abd.utils.monzo.types import Mastercard
-from abd.utils.monzo.types import MonzoResponse
-from abd.utils.monzo.types import P2PPayment
-from abd.utils.monzo.types import PostOfficeDeposit
-from abd.utils.monzo.types import PotTransfer
-from abd.utils.monzo.types import TransactionSchemes
-from abd.utils.monzo.types import UnknownTransaction
-from abd.utils.slack import app as slack_app
-
-req_handler = AsyncSlackRequestHandler(slack_app)
+from abd.utils.events import handle_event
+from abd.utils.health import prober
+from abd.utils.metrics import metrics
+from abd.utils.metrics import webhook_parse
+from abd.utils.monzo.types import decode_webhook
+from abd.utils.outbox import outbox
+from abd.utils.queue import queue
+from abd.utils.slack import request_handler
+from abd.utils.tenants import tenants
 
 
 async def endpoint(req: Request):
-    return await req_handler.handle(req)
+    return await request_handler().handle(req)
+
+
+prober.count("outbox", outbox.pending)
 
 
 async def health(req: Request):
-    monzo_healthy = await env.monzo_client.test_auth()
-    try:
-        await env.slack_client.api_test()
-        slack_healthy = True
-    except Exception:
-        slack_healthy = False
+    if req.query_params.get("deep") in ("1", "true"):
+        await prober.probe()
 
     return JSONResponse(
         {
-            "healthy": monzo_healthy and slack_healthy,
-            "monzo": monzo_healthy,
-            "slack": slack_healthy,
+            **prober.report(),
+            "dedup": {
+                "size": len(seen),
+                "hits": seen.hits,
+                "misses": seen.misses,
+            },
+            "circuits": {name: breaker.state for name, breaker in BREAKERS.items()},
+            "outbox": prober.sizes.get("outbox"),
         }
     )
 
@@ -45,75 +53,89 @@ async def health(req: Request):
 async def monzo_callback(req: Request):
     code = req.query_params.get("code", "")
     state = req.query_params.get("state")
-    if state != env.monzo_client.state:
+    tenant = tenants.for_state(state)
+    if not tenant:
         return JSONResponse({"error": "Invalid state"})
 
-    res = await env.monzo_client.exchange_code(code)
+    res = await tenant.monzo_client.exchange_code(code)
     if not res:
         return JSONResponse({"error": "Failed to exchange code"})
     return JSONResponse({"message": "Authorised"})
 
 
+async def prometheus(req: Request):
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 async def webhook(req: Request):
-    res = MonzoResponse.parse_obj(await req.json())
-    type = res.type
-    data = res.data
+    # everything before the body is read is cheap, so bad or excess requests cost little
     verif = req.query_params.get("verif")
-    if verif != env.webhook_verif:
-        await send_heartbeat(
-            heartbeat="Invalid verification code",
-            messages=[f"Code: `{verif}`\n```{data}```"],
-        )
+    source = req.client.host if req.client else "unknown"
+    tenant = tenants.for_webhook(verif)
+    if not tenant:
+        admission.reject("verification", f"Code: `{verif}` from {source}")
         return JSONResponse({"error": "Invalid verification code"})
 
-    if data.decline_reason:
-        await send_heartbeat(
-            heartbeat=f"Transaction declined for {data.decline_reason}",
-            messages=[f"```{data}```"],
+    if not admission.allow(source):
+        admission.reject("rate_limited", f"Too many requests from {source}")
+        return JSONResponse(
+            {"error": "Too many requests"},
+            status_code=429,
+            headers={"Retry-After": admission.retry_after},
+        )
+
+    status = admission.shed()
+    if status:
+        admission.reject("overloaded", f"Queue depth {queue.queue.qsize()}")
+        return JSONResponse(
+            {"error": "Too many pending events"},
+            status_code=status,
+            headers={"Retry-After": "1"},
+        )
+
+    body = await admission.read_body(req)
+    if body is None:
+        admission.reject(
+            "too_large", f"Body over {admission.max_body} bytes from {source}"
         )
+        return JSONResponse({"error": "Request body too large"}, status_code=413)
+
+    started = time.perf_counter()
+    try:
+        res = decode_webhook(body)
+    except ValidationError:
+        # rejected before it's marked as seen, so a corrected redelivery still gets through
+        return JSONResponse({"error": "Invalid webhook body"}, status_code=400)
+    webhook_parse.observe(time.perf_counter() - started)
+
+    key = event_key(body)
+    if key and await seen.check(key):
         return JSONResponse({"message": "Request successfully received"})
 
-    match type:
-        case "transaction.created":
-            try:
-                scheme = TransactionSchemes(data.scheme)
-            except ValueError:
-                scheme = None
-            match scheme:
-                case TransactionSchemes.Mastercard:
-                    if data.notes == "Active card check":
-                        return JSONResponse(
-                            {"message": "Request successfully received"}
-                        )
-                    transaction = Mastercard(data)
-                case TransactionSchemes.P2PPayment:
-                    transaction = P2PPayment(data)
-                case TransactionSchemes.FasterPayments:
-                    transaction = FasterPayments(data)
-                case TransactionSchemes.Bacs:
-                    transaction = Bacs(data)
-                case TransactionSchemes.PotTransfer:
-                    transaction = await PotTransfer.create(data)
-                case TransactionSchemes.PostOfficeDeposit:
-                    transaction = PostOfficeDeposit(data)
-                case _:
-                    transaction = UnknownTransaction(data)
-
-            await env.slack_client.chat_postMessage(
-                text=transaction.sentence,
-                channel=env.slack_log_channel,
-                icon_url=transaction.icon,
-                username=transaction.name,
-            )
-            await send_heartbeat(
-                heartbeat=transaction.sentence,
-                messages=[f"```{data}```"],
-            )
-        case _:
-            await send_heartbeat(
-                heartbeat=f"Unhandled webhook type: {type}",
-                messages=[f"```{data}```"],
-            )
+    try:
+        entry = outbox.add(tenant.id, body)
+    except Exception:
+        if key:
+            seen.forget(key)
+        raise
+    if not queue.enabled:
+        try:
+            await handle_event(tenant, res, entry, live=True)
+        except Exception:
+            if entry is None:
+                if key:
+                    seen.forget(key)
+                raise
+            # the outbox owns the retry, a redelivery from Monzo would post it twice
+            logging.exception("Failed to handle webhook, leaving it to the outbox")
+    elif not queue.put(handle_event, tenant, res, entry, True):
+        # Monzo retries a 503, so the event mustn't be replayed from here too
+        outbox.complete(entry)
+        if key:
+            seen.forget(key)
+        return JSONResponse({"error": "Too many pending events"}, status_code=503)
     return JSONResponse({"message": "Request successfully received"})
 
 
@@ -124,6 +146,7 @@ app = Starlette(
         Route(path="/health", endpoint=health, methods=["GET"]),
         Route(path="/monzo/callback", endpoint=monzo_callback, methods=["GET"]),
         Route(path="/webhook", endpoint=webhook, methods=["POST"]),
+        Route(path="/metrics", endpoint=prometheus, methods=["GET"]),
     ],
     lifespan=main,
 )
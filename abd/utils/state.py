@@ -0,0 +1,172 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from abd.utils.env import env
+from abd.utils.messages import messages
+from abd.utils.tenants import tenants
+
+VERSION = 1
+# files start with this and the salt their key was derived with
+MAGIC = b"abd-state:1:"
+SALT_SIZE = 16
+
+
+def derive(key: str, salt: bytes):
+    from cryptography.fernet import Fernet
+
+    # scrypt makes guessing a weak STATE_KEY from a leaked snapshot expensive
+    digest = hashlib.scrypt(key.encode(), salt=salt, n=2**14, r=8, p=1, dklen=32)
+    return Fernet(base64.urlsafe_b64encode(digest))
+
+
+class StateStore:
+    def __init__(self, path: str | None, key: str | None, interval: float) -> None:
+        self.path = path
+        self.interval = interval
+        self.dirty = False
+        self.saving: asyncio.Task | None = None
+        self.task: asyncio.Task | None = None
+        self.fernet = None
+        self.key = key
+        self.salt = os.urandom(SALT_SIZE)
+
+        if not path:
+            return
+        if not key:
+            raise ValueError("STATE_KEY is required when STATE_PATH is set")
+        try:
+            self.fernet = derive(key, self.salt)
+        except ImportError as e:
+            raise ImportError(
+                "Persisting state requires the state extra: pip install 'abd[state]'"
+            ) from e
+
+    @property
+    def enabled(self) -> bool:
+        return self.fernet is not None
+
+    def snapshot(self) -> dict:
+        return {
+            "version": VERSION,
+            "tenants": {tenant.id: tenant.monzo_client.dump() for tenant in tenants},
+            "messages": messages.dump(),
+        }
+
+    def load(self):
+        if not self.enabled or not os.path.exists(self.path):
+            return
+        from cryptography.fernet import InvalidToken
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            logging.warning(f"Ignoring {self.path}, it was saved in an older format")
+            return
+        salt = data[len(MAGIC) : len(MAGIC) + SALT_SIZE]
+        if salt != self.salt:
+            # keep the file's salt so later saves don't need the key derived again
+            self.salt = salt
+            self.fernet = derive(self.key, salt)
+        try:
+            state = json.loads(self.fernet.decrypt(data[len(MAGIC) + SALT_SIZE :]))
+        except InvalidToken:
+            logging.error(f"Could not decrypt {self.path}, ignoring saved state")
+            return
+        if state.get("version") != VERSION:
+            logging.warning(f"Ignoring saved state with version {state.get('version')}")
+            return
+
+        restored = 0
+        for id, data in state.get("tenants", {}).items():
+            tenant = tenants.get(id)
+            if tenant:
+                tenant.monzo_client.restore(data)
+                tenants.index_state(tenant)
+                restored += 1
+        messages.restore(state.get("messages", []))
+        logging.info(f"Restored state for {restored} tenant(s)")
+
+    def write(self, data: bytes):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".state-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    async def save(self):
+        if not self.enabled:
+            return
+        self.dirty = False
+        data = (
+            MAGIC
+            + self.salt
+            + self.fernet.encrypt(json.dumps(self.snapshot()).encode())
+        )
+        await asyncio.to_thread(self.write, data)
+
+    def mark_dirty(self):
+        if not self.enabled:
+            return
+        self.dirty = True
+        if self.saving:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # outside the event loop the periodic save picks the change up
+            return
+        self.saving = loop.create_task(self.save_soon())
+
+    async def save_soon(self):
+        try:
+            # coalesce bursts of changes (e.g. several tenants refreshing) into one write
+            await asyncio.sleep(0.5)
+            while self.dirty:
+                await self.save()
+        except Exception:
+            logging.exception("Failed to save state")
+        finally:
+            self.saving = None
+
+    async def loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except Exception:
+                logging.exception("Failed to save state")
+
+    def start(self):
+        if not self.enabled:
+            return
+        for tenant in tenants:
+            tenant.monzo_client.listeners.append(self.mark_dirty)
+        self.task = asyncio.create_task(self.loop())
+
+    async def stop(self):
+        if not self.enabled:
+            return
+        for tenant in tenants:
+            if self.mark_dirty in tenant.monzo_client.listeners:
+                tenant.monzo_client.listeners.remove(self.mark_dirty)
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.saving:
+            await asyncio.gather(self.saving, return_exceptions=True)
+        await self.save()
+
+
+store = StateStore(env.state_path, env.state_key, env.state_interval)
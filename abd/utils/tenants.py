@@ -0,0 +1,237 @@
+import hashlib
+import hmac
+import json
+import logging
+from typing import Iterator
+
+from aiohttp import ClientSession
+
+from abd.utils.breaker import monzo_breaker
+from abd.utils.env import env
+from abd.utils.metrics import metrics
+from abd.utils.monzo.handler import MonzoHandler
+
+
+def verif_digest(verif: str) -> bytes:
+    return hashlib.sha256(verif.encode()).digest()
+
+
+class Tenant:
+    __slots__ = ("id", "slack_user_id", "log_channel", "webhook_verif", "monzo_client")
+
+    def __init__(
+        self,
+        id: str,
+        slack_user_id: str,
+        log_channel: str,
+        webhook_verif: str,
+        monzo_client: MonzoHandler,
+    ) -> None:
+        self.id = id
+        self.slack_user_id = slack_user_id
+        self.log_channel = log_channel
+        self.webhook_verif = webhook_verif
+        self.monzo_client = monzo_client
+
+
+class TenantRegistry:
+    def __init__(self) -> None:
+        self.tenants: dict[str, Tenant] = {}
+        # keyed by digest so the lookup doesn't leak how much of a guessed code matched
+        self.by_verif: dict[bytes, Tenant] = {}
+        self.by_state: dict[str, Tenant] = {}
+        self.by_user: dict[str, Tenant] = {}
+        self.session: ClientSession | None = None
+
+    def __iter__(self) -> Iterator[Tenant]:
+        return iter(self.tenants.values())
+
+    def __len__(self) -> int:
+        return len(self.tenants)
+
+    def get(self, id: str) -> Tenant | None:
+        return self.tenants.get(id)
+
+    def create(
+        self,
+        id: str,
+        slack_user_id: str,
+        log_channel: str,
+        webhook_verif: str,
+        refresh_token: str | None = None,
+    ) -> Tenant:
+        monzo_client = MonzoHandler(
+            client_id=env.monzo_client_id,
+            client_secret=env.monzo_client_secret,
+            domain=env.domain,
+            webhook_verification=webhook_verif,
+            pot_cache_ttl=env.pot_cache_ttl,
+            pot_cache_size=env.pot_cache_size,
+            rate=env.monzo_rate / env.workers,
+            burst=env.monzo_burst,
+            timeout=env.monzo_timeout,
+            max_retries=env.monzo_max_retries,
+            base_url=env.monzo_api_url,
+            refresh_margin=env.token_refresh_margin,
+            breaker=monzo_breaker,
+        )
+        monzo_client.refresh_token = refresh_token
+        if self.session:
+            monzo_client.session = self.session
+
+        tenant = Tenant(id, slack_user_id, log_channel, webhook_verif, monzo_client)
+        if id in self.tenants:
+            self.remove(id)
+        digest = verif_digest(webhook_verif)
+        if digest in self.by_verif:
+            raise ValueError(f"Tenant {id} reuses the webhook verification code")
+        self.tenants[id] = tenant
+        self.by_verif[digest] = tenant
+        self.by_user[slack_user_id] = tenant
+        return tenant
+
+    def remove(self, id: str):
+        tenant = self.tenants.pop(id, None)
+        if not tenant:
+            return
+        self.by_verif.pop(verif_digest(tenant.webhook_verif), None)
+        if self.by_user.get(tenant.slack_user_id) is tenant:
+            del self.by_user[tenant.slack_user_id]
+        state = tenant.monzo_client.state
+        if state and self.by_state.get(state) is tenant:
+            del self.by_state[state]
+
+    def for_webhook(self, verif: str | None) -> Tenant | None:
+        if not verif:
+            return None
+        tenant = self.by_verif.get(verif_digest(verif))
+        if tenant and hmac.compare_digest(
+            tenant.webhook_verif.encode(), verif.encode()
+        ):
+            return tenant
+        return None
+
+    def for_state(self, state: str | None) -> Tenant | None:
+        return self.by_state.get(state) if state else None
+
+    def auth_url(self, tenant: Tenant) -> str:
+        old_state = tenant.monzo_client.state
+        if old_state:
+            self.by_state.pop(old_state, None)
+        url = tenant.monzo_client.generate_monzo_url()
+        self.index_state(tenant)
+        return url
+
+    def index_state(self, tenant: Tenant):
+        if tenant.monzo_client.state:
+            self.by_state[tenant.monzo_client.state] = tenant
+
+    def set_session(self, session: ClientSession):
+        self.session = session
+        for tenant in self:
+            tenant.monzo_client.session = session
+
+    def load(self):
+        if not env.tenants_file:
+            self.create(
+                id="default",
+                slack_user_id=env.slack_user_id,
+                log_channel=env.slack_log_channel,
+                webhook_verif=env.webhook_verif,
+            )
+            return
+
+        with open(env.tenants_file) as f:
+            for tenant in json.load(f):
+                self.create(
+                    id=tenant["id"],
+                    slack_user_id=tenant["slack_user_id"],
+                    log_channel=tenant["log_channel"],
+                    webhook_verif=tenant["webhook_verif"],
+                    refresh_token=tenant.get("refresh_token"),
+                )
+        logging.info(f"Loaded {len(self)} tenants from {env.tenants_file}")
+
+
+def monzo_endpoints():
+    totals: dict[str, list] = {}
+    for tenant in tenants:
+        for endpoint, stats in tenant.monzo_client.stats.items():
+            total = totals.setdefault(endpoint, [{}, 0.0, 0, 0])
+            for status, count in stats.statuses.items():
+                total[0][status] = total[0].get(status, 0) + count
+            total[1] += stats.latency
+            total[2] += stats.retries
+            total[3] += stats.errors
+    return totals
+
+
+def monzo_sum(attr: str):
+    return lambda: [("", {}, sum(getattr(t.monzo_client, attr) for t in tenants))]
+
+
+tenants = TenantRegistry()
+tenants.load()
+
+metrics.collector(
+    "abd_monzo_requests_total",
+    "Monzo API responses by endpoint and status",
+    "counter",
+    lambda: [
+        ("", {"endpoint": endpoint, "status": status}, count)
+        for endpoint, total in monzo_endpoints().items()
+        for status, count in total[0].items()
+    ],
+)
+metrics.collector(
+    "abd_monzo_request_seconds_total",
+    "Time spent waiting on Monzo API responses by endpoint",
+    "counter",
+    lambda: [
+        ("", {"endpoint": endpoint}, total[1])
+        for endpoint, total in monzo_endpoints().items()
+    ],
+)
+metrics.collector(
+    "abd_monzo_retries_total",
+    "Retried Monzo API requests by endpoint",
+    "counter",
+    lambda: [
+        ("", {"endpoint": endpoint}, total[2])
+        for endpoint, total in monzo_endpoints().items()
+    ],
+)
+metrics.collector(
+    "abd_monzo_errors_total",
+    "Monzo API requests that failed without a response by endpoint",
+    "counter",
+    lambda: [
+        ("", {"endpoint": endpoint}, total[3])
+        for endpoint, total in monzo_endpoints().items()
+    ],
+)
+metrics.collector(
+    "abd_monzo_rate_limit_wait_seconds_total",
+    "Time Monzo requests spent waiting for the client-side rate limiter",
+    "counter",
+    lambda: [("", {}, sum(t.monzo_client.limiter.waited for t in tenants))],
+)
+metrics.collector(
+    "abd_monzo_retry_sleep_seconds_total",
+    "Time spent backing off before retrying Monzo requests",
+    "counter",
+    monzo_sum("retry_sleep"),
+)
+metrics.collector(
+    "abd_monzo_token_refreshes_total",
+    "Successful Monzo access token refreshes",
+    "counter",
+    monzo_sum("refreshes"),
+)
+metrics.collector(
+    "abd_monzo_token_refresh_failures_total",
+    "Failed Monzo access token refreshes",
+    "counter",
+    monzo_sum("refresh_failures"),
+)
+metrics.gauge("abd_tenants", "Registered tenants", lambda: len(tenants))
@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+
+from aiohttp import ClientSession
+
+from benchmarks.payloads import SCHEMES
+from benchmarks.payloads import transaction
+from benchmarks.stubs import app_env
+from benchmarks.stubs import FakeMonzo
+from benchmarks.stubs import FakeSlack
+from benchmarks.stubs import serve
+from benchmarks.stubs import start_app
+from benchmarks.stubs import VERIF
+from benchmarks.stubs import wait_until_up
+
+
+async def settle(calls: Counter, quiet: float = 2.0, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    last = -1
+    while time.monotonic() < deadline:
+        total = sum(calls.values())
+        if total == last:
+            return
+        last = total
+        await asyncio.sleep(quiet)
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def run(args: argparse.Namespace):
+    monzo = FakeMonzo(args.monzo_latency, args.monzo_401, args.monzo_429)
+    slack = FakeSlack(args.slack_latency, args.slack_429)
+    runners = [
+        await serve(monzo.app(), args.monzo_port),
+        await serve(slack.app(), args.slack_port),
+    ]
+
+    env = app_env(
+        args.port,
+        args.monzo_port,
+        args.slack_port,
+        # the fake Slack API doesn't rate limit, so don't pace posts to it either
+        SLACK_CHANNEL_RATE=str(args.slack_channel_rate),
+        SLACK_CHANNEL_BURST=str(args.slack_channel_rate),
+    )
+    if args.heartbeat:
+        env["SLACK_HEARTBEAT_CHANNEL"] = "C_HEARTBEAT"
+    workdir = tempfile.TemporaryDirectory()
+    if args.workers > 1:
+        env["WORKERS"] = str(args.workers)
+        env["COORDINATOR_PATH"] = os.path.join(workdir.name, "coordinator.db")
+        env["LEDGER_PATH"] = os.path.join(workdir.name, "ledger.db")
+    server = start_app(env, args.port, args.workers)
+
+    schemes = list(SCHEMES)
+    latencies: list[float] = []
+    statuses: Counter[int] = Counter()
+    url = f"http://127.0.0.1:{args.port}/webhook?verif={VERIF}"
+
+    try:
+        async with ClientSession() as session:
+            await wait_until_up(session, f"http://127.0.0.1:{args.port}/health")
+            await settle(slack.calls)
+            monzo.calls.clear()
+            slack.calls.clear()
+
+            bodies = asyncio.Queue()
+            for i in range(args.events):
+                scheme = schemes[i % len(schemes)]
+                bodies.put_nowait(json.dumps(transaction(scheme, id=f"tx_{i:08d}")))
+
+            async def client():
+                while not bodies.empty():
+                    body = bodies.get_nowait()
+                    started = time.perf_counter()
+                    async with session.post(url, data=body) as res:
+                        await res.read()
+                        statuses[res.status] += 1
+                    latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+            await settle(slack.calls)
+            async with session.get(f"http://127.0.0.1:{args.port}/metrics") as res:
+                connections = {
+                    line.split('"')[1]: float(line.split()[-1])
+                    for line in (await res.text()).splitlines()
+                    if line.startswith("abd_http_connections_total{")
+                }
+    finally:
+        server.terminate()
+        server.wait()
+        for runner in runners:
+            await runner.cleanup()
+        workdir.cleanup()
+
+    print(
+        f"events:       {args.events} in {elapsed:.2f}s ({args.events / elapsed:.1f}/s)"
+    )
+    print(f"statuses:     {dict(statuses)}")
+    for p in (50, 95, 99):
+        print(f"p{p}:          {percentile(latencies, p) * 1000:.2f} ms")
+    print(f"monzo calls:  {dict(monzo.calls)}")
+    print(f"slack calls:  {dict(slack.calls)}")
+    print(f"monzo/event:  {sum(monzo.calls.values()) / args.events:.2f}")
+    print(f"slack/event:  {sum(slack.calls.values()) / args.events:.2f}")
+    # with several workers this is whichever one answered the scrape
+    print(
+        f"connections:  {connections.get('created', 0):.0f} opened,"
+        f" {connections.get('reused', 0):.0f} reused"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the /webhook endpoint")
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--port", type=int, default=3100)
+    parser.add_argument("--monzo-port", type=int, default=3101)
+    parser.add_argument("--slack-port", type=int, default=3102)
+    parser.add_argument("--monzo-latency", type=float, default=0.05)
+    parser.add_argument("--slack-latency", type=float, default=0.05)
+    parser.add_argument("--monzo-401", type=float, default=0.0)
+    parser.add_argument("--monzo-429", type=float, default=0.0)
+    parser.add_argument("--slack-429", type=float, default=0.0)
+    parser.add_argument("--slack-channel-rate", type=float, default=1000)
+    parser.add_argument("--heartbeat", action="store_true")
+    parser.add_argument("--workers", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
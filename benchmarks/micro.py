@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+
+from abd.utils.monzo.render import format_amount
+from abd.utils.monzo.render import render
+from abd.utils.monzo.render import RENDERERS
+from abd.utils.monzo.render import unknown_renderer
+from abd.utils.monzo.types import decode_webhook
+from abd.utils.monzo.types import MonzoResponse
+from benchmarks.payloads import body
+from benchmarks.payloads import SCHEMES
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+POT = {"name": "Savings", "cover_image_url": "https://example.com/cover.png"}
+
+
+def cases(raw: bytes) -> dict:
+    data = MonzoResponse.model_validate_json(raw).data
+    renderer = RENDERERS.get(data.scheme) or unknown_renderer(data.scheme)
+    transaction = render(data, "U00009ABC", POT)
+    words = {
+        "emoji": transaction.emoji,
+        "user": "U00009ABC",
+        "action": renderer.actions[0],
+        "amount": transaction.amount_str,
+        "direction": renderer.directions[0],
+        "merchant": transaction.merchant_name or "somewhere",
+        "region": "",
+        "category": f" on {transaction.category}",
+    }
+    return {
+        "validate": lambda: MonzoResponse.model_validate_json(raw),
+        "decode": lambda: decode_webhook(raw),
+        "render": lambda: render(data, "U00009ABC", POT),
+        "currency": lambda: format_amount(
+            data.local_amount, data.local_currency, data.amount, data.currency
+        ),
+        "sentence": lambda: renderer.template.format(**words),
+    }
+
+
+def measure(fn, repeat: int) -> float:
+    timer = timeit.Timer(fn)
+    # many short samples make the minimum less sensitive to a noisy machine
+    number = max(1, timer.autorange()[0] // 4)
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run(repeat: int) -> dict[str, dict[str, float]]:
+    results = {}
+    for scheme in SCHEMES:
+        name = scheme.value if scheme else "unknown"
+        results[name] = {
+            case: measure(fn, repeat) * 1e6 for case, fn in cases(body(scheme)).items()
+        }
+    return results
+
+
+def show(results: dict, baseline: dict | None, threshold: float) -> list[str]:
+    columns = next(iter(results.values()))
+    print(f"{'scheme':<36}" + "".join(f"{case:>18}" for case in columns))
+    regressions = []
+    for name, timings in results.items():
+        cells = []
+        for case, us in timings.items():
+            before = (baseline or {}).get(name, {}).get(case)
+            if not before:
+                cells.append(f"{us:>15.2f} us")
+                continue
+            change = us / before - 1
+            flag = "!" if change > threshold else " "
+            if change > threshold:
+                regressions.append(f"{name} {case}: {before:.2f} -> {us:.2f} us")
+            cells.append(f"{us:>8.2f} {change:+6.0%}{flag}")
+        print(f"{name:<36}" + "".join(f"{cell:>18}" for cell in cells))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time parsing and rendering of each transaction scheme, in microseconds per event"
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument(
+        "--save", action="store_true", help="store the results as the new baseline"
+    )
+    parser.add_argument(
+        "--compare", action="store_true", help="flag cases slower than the baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="fraction slower than the baseline that counts as a regression",
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    results = run(args.repeat)
+    regressions = show(results, baseline, args.threshold)
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regressions over {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
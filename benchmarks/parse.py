@@ -0,0 +1,29 @@
+import json
+import timeit
+
+from abd.utils.monzo.types import decode_webhook
+from abd.utils.monzo.types import MonzoResponse
+from benchmarks.payloads import body
+from benchmarks.payloads import SCHEMES
+
+DECODERS = {
+    "json + validate": lambda raw: MonzoResponse.model_validate(json.loads(raw)),
+    "lenient bytes": MonzoResponse.model_validate_json,
+    "compact bytes": decode_webhook,
+}
+
+
+def main(number: int = 20000):
+    print(f"{'scheme':<40}" + "".join(f"{name:>18}" for name in DECODERS))
+    for scheme in SCHEMES:
+        raw = body(scheme)
+        timings = [
+            min(timeit.repeat(lambda: decoder(raw), number=number, repeat=3)) / number
+            for decoder in DECODERS.values()
+        ]
+        name = scheme.value if scheme else "unknown"
+        print(f"{name:<40}" + "".join(f"{t * 1e6:>15.2f} us" for t in timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import json
+
+from abd.utils.monzo.types import TransactionSchemes
+
+MERCHANT = {
+    "address": {
+        "address": "1 Example Street",
+        "city": "London",
+        "country": "GBR",
+        "latitude": 51.5,
+        "longitude": -0.12,
+        "postcode": "EC1A 1AA",
+        "region": "Greater London",
+        "short_formatted": "1 Example Street, London EC1A 1AA",
+        "formatted": "1 Example Street\nLondon\nEC1A 1AA\nUnited Kingdom",
+    },
+    "created": "2024-01-01T12:00:00.000Z",
+    "group_id": "grp_00009abc",
+    "id": "merch_00009abc",
+    "logo": "https://mondo-logo-cache.appspot.com/twitter/example/?size=large",
+    "emoji": "🍞",
+    "name": "Example Bakery",
+    "category": "eating_out",
+    "online": False,
+    "atm": False,
+    "disable_feedback": False,
+    "metadata": {"website": "https://example.com", "twitter_id": "example"},
+}
+
+SCHEMES = {
+    TransactionSchemes.Mastercard: {"amount": -450, "merchant": MERCHANT},
+    TransactionSchemes.P2PPayment: {"amount": 1500, "category": "transfers"},
+    TransactionSchemes.FasterPayments: {"amount": -25000, "category": "bills"},
+    TransactionSchemes.Bacs: {"amount": -1299, "category": "bills"},
+    TransactionSchemes.PotTransfer: {
+        "amount": -100,
+        "category": "savings",
+        "metadata": {"pot_id": "pot_00009abc", "trigger": "coin_jar"},
+    },
+    TransactionSchemes.PostOfficeDeposit: {"amount": 2000, "category": "general"},
+    None: {"amount": -300, "scheme": "uk_business_transfer"},
+}
+
+
+def transaction(
+    scheme: TransactionSchemes | None,
+    id: str = "tx_00009abc",
+    type: str = "transaction.created",
+    **overrides,
+) -> dict:
+    defaults = SCHEMES[scheme]
+    data = {
+        "account_id": "acc_00009abc",
+        "amount": defaults["amount"],
+        "created": "2024-01-01T12:00:00.000Z",
+        "currency": "GBP",
+        "description": "EXAMPLE",
+        "id": id,
+        "category": defaults.get("category", "eating_out"),
+        "is_load": False,
+        "settled": "",
+        "local_amount": defaults["amount"],
+        "local_currency": "GBP",
+        "merchant": defaults.get("merchant"),
+        "metadata": {
+            "ledger_insertion_id": "entryset_0000",
+            **defaults.get("metadata", {}),
+        },
+        "notes": "",
+        "scheme": scheme.value if scheme else defaults["scheme"],
+        "counterparty": {"name": "Sam Example", "user_id": "user_00009abc"},
+        "dedupe_id": "com.monzo.example",
+        "labels": None,
+        "attachments": [],
+        "international": None,
+        "categories": {defaults.get("category", "eating_out"): defaults["amount"]},
+        "can_be_excluded_from_breakdown": True,
+        "can_add_to_tab": False,
+        "can_split_the_bill": True,
+        "amount_is_pending": False,
+        "atm_fees_detailed": None,
+        "parent_account_id": "",
+    }
+    data.update(overrides)
+    return {"type": type, "data": data}
+
+
+def body(scheme: TransactionSchemes | None, **overrides) -> bytes:
+    return json.dumps(transaction(scheme, **overrides)).encode()
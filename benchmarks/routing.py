@@ -0,0 +1,105 @@
+import argparse
+import os
+import random
+import timeit
+
+from abd.utils.monzo.render import render
+from abd.utils.monzo.types import MonzoResponse
+from benchmarks.payloads import body
+from benchmarks.payloads import SCHEMES
+from benchmarks.stubs import app_env
+
+# the routing module reads its rules from the app's environment on import
+os.environ.update(app_env(0, 0, 0))
+
+from abd.utils.routing import attributes  # noqa: E402
+from abd.utils.routing import FIELDS  # noqa: E402
+from abd.utils.routing import RoutingTable  # noqa: E402
+
+CATEGORIES = ["groceries", "eating_out", "bills", "transport", "shopping", "savings"]
+CURRENCIES = ["GBP", "EUR", "USD"]
+
+
+def rules(count: int, seed: int = 1) -> list[dict]:
+    rng = random.Random(seed)
+    generated = []
+    for n in range(count):
+        rule = {"channel": f"C{n % 50:04d}"}
+        if rng.random() < 0.5:
+            rule["category"] = rng.choice(CATEGORIES)
+        if rng.random() < 0.3:
+            rule["scheme"] = rng.choice([s.value for s in SCHEMES if s])
+        if rng.random() < 0.2:
+            rule["currency"] = rng.choice(CURRENCIES)
+        if rng.random() < 0.2:
+            rule["merchant"] = f"merch_{rng.randrange(count):08d}"
+        if rng.random() < 0.3:
+            rule["min_amount"] = rng.randrange(0, 10000)
+        generated.append(rule)
+    return generated
+
+
+def scan(rules: list[dict], transaction) -> list[str]:
+    # what matching looks like without the compiled table
+    values = dict(zip(FIELDS, attributes(transaction)))
+    amount = abs(transaction.local_amount)
+    channels = []
+    for rule in rules:
+        if not rule.get("min_amount", 0) <= amount <= rule.get("max_amount", amount):
+            continue
+        if all(
+            rule.get(field) is None
+            or any(
+                v is not None and v.casefold() == rule[field].casefold()
+                for v in values[field]
+            )
+            for field in FIELDS
+        ):
+            if rule["channel"] not in channels:
+                channels.append(rule["channel"])
+    return channels
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time matching a transaction against routing rules, in microseconds per event"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    transactions = [
+        render(MonzoResponse.model_validate_json(body(scheme)).data, "U00009ABC")
+        for scheme in SCHEMES
+    ]
+    print(f"{'rules':>8}{'compiled':>16}{'scan':>16}{'matches':>10}")
+    for size in args.sizes:
+        generated = rules(size)
+        table = RoutingTable(generated)
+        for transaction in transactions:
+            assert table.match(transaction) == scan(generated, transaction)
+        number = max(1, args.number * 10 // size) if size > 100 else args.number
+        compiled = min(
+            timeit.repeat(
+                lambda: [table.match(t) for t in transactions], number=number, repeat=3
+            )
+        )
+        linear = min(
+            timeit.repeat(
+                lambda: [scan(generated, t) for t in transactions],
+                number=max(1, number // 10),
+                repeat=3,
+            )
+        )
+        matches = sum(len(table.match(t)) for t in transactions) / len(transactions)
+        per_event = len(transactions)
+        print(
+            f"{size:>8}"
+            f"{compiled / number / per_event * 1e6:>13.2f} us"
+            f"{linear / max(1, number // 10) / per_event * 1e6:>13.2f} us"
+            f"{matches:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
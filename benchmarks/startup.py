@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from aiohttp import ClientError
+from aiohttp import ClientSession
+
+from abd.utils.monzo.types import TransactionSchemes
+from benchmarks.payloads import transaction
+from benchmarks.stubs import app_env
+from benchmarks.stubs import FakeMonzo
+from benchmarks.stubs import FakeSlack
+from benchmarks.stubs import serve
+from benchmarks.stubs import start_app
+from benchmarks.stubs import VERIF
+
+IMPORT = "import time; t = time.perf_counter(); import abd.utils.starlette; print(time.perf_counter() - t)"
+
+
+def import_time(env: dict) -> float:
+    res = subprocess.run(
+        [sys.executable, "-c", IMPORT], env=env, capture_output=True, text=True
+    )
+    if res.returncode:
+        raise RuntimeError(res.stderr)
+    return float(res.stdout.strip().splitlines()[-1])
+
+
+async def first_request(env: dict, port: int, timeout: float = 30) -> float:
+    url = f"http://127.0.0.1:{port}/webhook?verif={VERIF}"
+    body = json.dumps(transaction(TransactionSchemes.Mastercard, id="tx_startup"))
+    started = time.perf_counter()
+    server = start_app(env, port)
+    try:
+        async with ClientSession() as session:
+            while time.perf_counter() - started < timeout:
+                try:
+                    async with session.post(url, data=body) as res:
+                        if res.status == 200:
+                            return time.perf_counter() - started
+                except ClientError:
+                    pass
+                await asyncio.sleep(0.005)
+        raise TimeoutError("The app never answered a webhook")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def summarise(name: str, values: list[float]):
+    print(
+        f"{name:<20} median {statistics.median(values) * 1000:8.1f} ms"
+        f"   min {min(values) * 1000:8.1f} ms   max {max(values) * 1000:8.1f} ms"
+    )
+
+
+async def run(args: argparse.Namespace):
+    monzo = FakeMonzo(args.monzo_latency, 0, 0)
+    slack = FakeSlack(args.slack_latency, 0)
+    runners = [
+        await serve(monzo.app(), args.monzo_port),
+        await serve(slack.app(), args.slack_port),
+    ]
+    env = app_env(args.port, args.monzo_port, args.slack_port)
+    if args.heartbeat:
+        env["SLACK_HEARTBEAT_CHANNEL"] = "C_HEARTBEAT"
+
+    try:
+        imports = [import_time(env) for _ in range(args.runs)]
+        firsts = [await first_request(env, args.port) for _ in range(args.runs)]
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+    summarise("import", imports)
+    summarise("first webhook", firsts)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure import time and time to the first answered webhook"
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=3100)
+    parser.add_argument("--monzo-port", type=int, default=3101)
+    parser.add_argument("--slack-port", type=int, default=3102)
+    parser.add_argument("--monzo-latency", type=float, default=0.05)
+    parser.add_argument("--slack-latency", type=float, default=0.2)
+    parser.add_argument("--heartbeat", action="store_true")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from aiohttp import ClientSession
+from aiohttp import web
+
+VERIF = "loadtest"
+
+
+class FakeMonzo:
+    def __init__(self, latency: float, unauthorised: float, rate_limited: float):
+        self.latency = latency
+        self.unauthorised = unauthorised
+        self.rate_limited = rate_limited
+        self.calls: Counter[str] = Counter()
+        self.token = 0
+
+    async def respond(self, req: web.Request, body: dict) -> web.Response:
+        self.calls[req.path] += 1
+        await asyncio.sleep(self.latency)
+        if random.random() < self.rate_limited:
+            return web.json_response({}, status=429, headers={"Retry-After": "1"})
+        if req.path != "/oauth2/token":
+            if req.headers.get("Authorization") != f"Bearer token-{self.token}":
+                return web.json_response({}, status=401)
+            if random.random() < self.unauthorised:
+                self.token += 1
+                return web.json_response({}, status=401)
+        return web.json_response(body)
+
+    async def whoami(self, req: web.Request) -> web.Response:
+        return await self.respond(req, {"authenticated": True, "user_id": "user_1"})
+
+    async def accounts(self, req: web.Request) -> web.Response:
+        return await self.respond(req, {"accounts": [{"id": "acc_00009abc"}]})
+
+    async def pots(self, req: web.Request) -> web.Response:
+        pots = [{"id": "pot_00009abc", "name": "Savings", "cover_image_url": None}]
+        return await self.respond(req, {"pots": pots})
+
+    async def webhooks(self, req: web.Request) -> web.Response:
+        return await self.respond(req, {"webhooks": []})
+
+    async def oauth(self, req: web.Request) -> web.Response:
+        self.token += 1
+        return await self.respond(
+            req,
+            {
+                "access_token": f"token-{self.token}",
+                "refresh_token": "refresh",
+                "expires_in": 21600,
+                "user_id": "user_1",
+            },
+        )
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/ping/whoami", self.whoami)
+        app.router.add_get("/accounts", self.accounts)
+        app.router.add_get("/pots", self.pots)
+        app.router.add_get("/webhooks", self.webhooks)
+        app.router.add_post("/oauth2/token", self.oauth)
+        return app
+
+
+class FakeSlack:
+    def __init__(self, latency: float, rate_limited: float):
+        self.latency = latency
+        self.rate_limited = rate_limited
+        self.calls: Counter[str] = Counter()
+
+    async def method(self, req: web.Request) -> web.Response:
+        method = req.match_info["method"]
+        self.calls[method] += 1
+        await asyncio.sleep(self.latency)
+        if random.random() < self.rate_limited:
+            return web.json_response(
+                {"ok": False, "error": "ratelimited"},
+                status=429,
+                headers={"Retry-After": "1"},
+            )
+        # slack_sdk sends chat.* arguments as JSON and the rest as a form
+        if req.content_type == "application/json":
+            args = await req.json()
+        else:
+            args = await req.post()
+        return web.json_response(
+            {"ok": True, "channel": args.get("channel"), "ts": f"{time.time():.6f}"}
+        )
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/api/{method}", self.method)
+        return app
+
+
+async def serve(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def wait_until_up(session: ClientSession, url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url) as res:
+                if res.status == 200:
+                    return
+        except OSError:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up")
+
+
+def app_env(port: int, monzo_port: int, slack_port: int, **extra: str) -> dict:
+    return {
+        **os.environ,
+        "SLACK_BOT_TOKEN": "xoxb-loadtest",
+        "SLACK_SIGNING_SECRET": "loadtest",
+        "SLACK_LOG_CHANNEL": "C_LOG",
+        "SLACK_USER_ID": "U_LOADTEST",
+        "MONZO_CLIENT_ID": "loadtest",
+        "MONZO_CLIENT_SECRET": "loadtest",
+        "DOMAIN": f"http://127.0.0.1:{port}",
+        "WEBHOOK_VERIF": VERIF,
+        "ENVIRONMENT": "production",
+        "MONZO_API_URL": f"http://127.0.0.1:{monzo_port}",
+        "SLACK_API_URL": f"http://127.0.0.1:{slack_port}/api/",
+        # every simulated webhook comes from localhost
+        "WEBHOOK_SOURCE_RATE": "0",
+        # the fixtures share one account, so batching would fold most of them into a few posts
+        "COALESCE_WINDOW": "0",
+        **extra,
+    }
+
+
+def start_app(env: dict, port: int, workers: int = 1) -> subprocess.Popen:
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "abd.utils.starlette:app",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+    )